@@ -0,0 +1,69 @@
+"""
+Compares the BeautifulSoup parse previously used by AniRotationEngine._spam_detection
+with the streaming NomoroboProvider scan on lookup-page sized documents,
+reporting time and peak allocated memory per lookup.
+
+Usage: python benchmarks/spam_classifier.py [page_kb ...]
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from handler_cf_v1.spam import NomoroboProvider
+
+CHUNK_SIZE = NomoroboProvider.chunk_size
+
+
+def build_page(size_kb, not_found):
+    head = "<html><head><title>Lookup</title><style>body {color: #404040}</style>" \
+        "<script>var errors = [404, 500];</script></head><body><nav><ul><li>Home</li></ul></nav>"
+    body = "<h1>{}</h1>".format("404 Page not found" if not_found else "Robocaller reported")
+    filler = "<div class='report'><p>Caller reported on 01/01/2022, a recorded message.</p></div>\n"
+    repeat = max(size_kb * 1024 // len(filler), 1)
+    footer = "<footer>Error code 404 help</footer><script>track(404)</script></body></html>"
+    return (head + body + filler * repeat + footer).encode("utf-8")
+
+
+def beautifulsoup_is_spam(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    for script in soup(["script", "style", "br", "footer", "ul", "nav"]):
+        script.extract()
+    text = (soup.get_text().replace('\n', '').strip())
+    return "404" not in text
+
+
+def streaming_is_spam(content):
+    chunks = (content[start:start + CHUNK_SIZE].decode("utf-8")
+              for start in range(0, len(content), CHUNK_SIZE))
+    return not NomoroboProvider.scan(chunks)
+
+
+def measure(func, content):
+    seconds = min(timeit.repeat(lambda: func(content), number=1, repeat=5))
+    tracemalloc.start()
+    func(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main(sizes):
+    print(f"{'page':>10}{'verdict':>9}{'bs4 (ms)':>10}{'stream (ms)':>13}{'speedup':>9}"
+          f"{'bs4 peak (KB)':>15}{'stream peak (KB)':>18}")
+    for size in sizes:
+        for not_found in [True, False]:
+            content = build_page(size, not_found)
+            assert beautifulsoup_is_spam(content) == streaming_is_spam(content)
+            old_time, old_peak = measure(beautifulsoup_is_spam, content)
+            new_time, new_peak = measure(streaming_is_spam, content)
+            print(f"{size:>8}KB{'clean' if not_found else 'spam':>9}{old_time * 1000:>10.2f}"
+                  f"{new_time * 1000:>13.2f}{old_time / new_time:>8.1f}x"
+                  f"{old_peak / 1024:>15.0f}{new_peak / 1024:>18.0f}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [20, 100, 300])
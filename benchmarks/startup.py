@@ -0,0 +1,75 @@
+"""
+Cold start benchmark for the service classes.
+
+Every service class is measured in a fresh interpreter: the time it takes to
+import handler_cf_v1.services and resolve the class, the time it takes to load
+the dependencies the class needs on first use, and the peak RSS of the process.
+
+Usage: python benchmarks/startup.py [ServiceName ...]
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["five9", "zeep", "sqlalchemy",
+                 "google.cloud.firestore", "pandas", "bs4"]
+
+# Modules each service imports the first time execute_service runs.
+FIRST_USE = {
+    "MissionRealty": [],
+    "OwnLaHomes": [],
+    "LeviKvCore": [],
+    "MultiLeadUpdate": ["five9", "pandas"],
+    "AniRotationEngine": ["five9", "google.cloud.firestore"],
+    "Five9ToMySQL": ["sqlalchemy"],
+    "Five9ToGHL": ["five9"],
+    "GHLPipelineSync": ["five9"],
+}
+
+PROBE = """
+import importlib, json, resource, sys, time
+start = time.perf_counter()
+services = importlib.import_module("handler_cf_v1.services")
+getattr(services, {name!r})
+import_time = time.perf_counter() - start
+loaded_on_import = [m for m in {heavy!r} if m in sys.modules]
+start = time.perf_counter()
+missing = []
+for module in {first_use!r}:
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        missing.append(module)
+first_use_time = time.perf_counter() - start
+print(json.dumps({{
+    "import_s": import_time,
+    "first_use_s": first_use_time,
+    "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "loaded_on_import": loaded_on_import,
+    "missing": missing,
+}}))
+"""
+
+
+def measure(name):
+    code = PROBE.format(name=name, heavy=HEAVY_MODULES,
+                        first_use=FIRST_USE[name])
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    return json.loads(output.stdout)
+
+
+def main(names):
+    print(f"{'service':<20}{'import (s)':>12}{'first use (s)':>15}{'peak RSS (MB)':>15}  heavy modules on import")
+    for name in names:
+        result = measure(name)
+        print(f"{name:<20}{result['import_s']:>12.4f}{result['first_use_s']:>15.4f}"
+              f"{result['peak_rss_kb'] / 1024:>15.1f}  {', '.join(result['loaded_on_import']) or '-'}"
+              + (f" (not installed: {', '.join(result['missing'])})" if result['missing'] else ""))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or list(FIRST_USE))
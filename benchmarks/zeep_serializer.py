@@ -0,0 +1,66 @@
+"""
+Compares literal_eval(str(response)) with serialize_zeep on getContactRecords
+like responses built with zeep, reporting time and peak allocated memory.
+
+Usage: python benchmarks/zeep_serializer.py [records ...]
+"""
+from ast import literal_eval
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zeep import xsd
+from handler_cf_v1.apps import serialize_zeep
+
+FIELDS = ["number1", "number2", "number3", "first_name", "last_name", "company",
+          "street", "city", "state", "zip", "email", "contact_id"] + [f"custom_{i}" for i in range(18)]
+
+Data = xsd.ComplexType(xsd.Sequence([
+    xsd.Element("data", xsd.String(), min_occurs=0, max_occurs="unbounded")
+]))
+Record = xsd.ComplexType(xsd.Sequence([
+    xsd.Element("key", xsd.String(), min_occurs=0),
+    xsd.Element("values", Data)
+]))
+ContactRecords = xsd.ComplexType(xsd.Sequence([
+    xsd.Element("fields", xsd.String(), min_occurs=0, max_occurs="unbounded"),
+    xsd.Element("records", Record, min_occurs=0, max_occurs="unbounded")
+]))
+
+
+def build_response(size):
+    records = []
+    for i in range(size):
+        data = [f"{3055550000 + i}", None, f"{7865550000 + i}", "John", "Doe"] + \
+            [f"value {i} {j}" for j in range(len(FIELDS) - 5)]
+        records.append(Record(key=None, values=Data(data=data)))
+    return ContactRecords(fields=FIELDS, records=records)
+
+
+def measure(func, response, repeat):
+    seconds = min(timeit.repeat(lambda: func(response), number=1, repeat=repeat))
+    tracemalloc.start()
+    func(response)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main(sizes):
+    print(f"{'records':>8}{'literal_eval (s)':>18}{'serialize (s)':>15}{'speedup':>9}"
+          f"{'literal_eval peak (MB)':>24}{'serialize peak (MB)':>21}")
+    for size in sizes:
+        response = build_response(size)
+        assert serialize_zeep(response) == literal_eval(str(response))
+        repeat = 3 if size >= 1000 else 10
+        old_time, old_peak = measure(lambda r: literal_eval(str(r)), response, repeat)
+        new_time, new_peak = measure(serialize_zeep, response, repeat)
+        print(f"{size:>8}{old_time:>18.4f}{new_time:>15.4f}{old_time / new_time:>8.1f}x"
+              f"{old_peak / 2 ** 20:>24.2f}{new_peak / 2 ** 20:>21.2f}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [10, 100, 500, 1000])
@@ -1,16 +1,35 @@
 from typing import Any
-import requests
 import json
-from .exceptions import ApiError
-from five9 import Five9
-from ast import literal_eval
-from sqlalchemy import create_engine
+from .exceptions import ApiError, DnisSwapError
+from .transport import http_transport
+from .cache import TTLCache, MetadataCache, FirestoreBackend
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import os
+import threading
+import time
+
+
+# Location API keys keyed by (agency_api_key, location_id).
+location_key_cache = TTLCache(
+    maxsize=256,
+    ttl=float(os.environ.get('GHL_LOCATION_KEY_TTL', 3600))
+)
+
+# Custom fields and pipelines per location, GHL_METADATA_COLLECTION enables
+# the Firestore copy shared between instances.
+metadata_cache = MetadataCache(
+    backend=FirestoreBackend(os.environ['GHL_METADATA_COLLECTION'])
+    if os.environ.get('GHL_METADATA_COLLECTION') else None,
+    ttl=float(os.environ.get('GHL_METADATA_TTL', 300)),
+    stale_ttl=float(os.environ.get('GHL_METADATA_STALE_TTL', 3600))
+)
 
 
 class SierraInteractive:
 
     def __init__(self, api_key: str, originating_system: str) -> None:
         self.api_key = api_key
+        self.http = http_transport
         self.find_leads_ep = "https://api.sierrainteractivedev.com/leads/find?{}"
         self.add_note_ep = "https://api.sierrainteractivedev.com/leads/{}/note"
         self.retrieve_lead_details_ep = "https://api.sierrainteractivedev.com/leads/get/{}"
@@ -31,7 +50,7 @@ class SierraInteractive:
         """
 
         if not lead_email:
-            response = requests.get(
+            response = self.http.get(
                 self.find_leads_ep.format(f'phone={lead_phone.strip()}'),
                 headers=self.headers
             )
@@ -41,7 +60,7 @@ class SierraInteractive:
             if json_response['data']['totalRecords'] > 0:
                 return json_response['data']['leads'][0]
             return None
-        response = requests.get(
+        response = self.http.get(
             self.retrieve_lead_details_ep.format(lead_email.strip()),
             headers=self.headers
         )
@@ -83,7 +102,7 @@ class SierraInteractive:
         """
         if not payload['email']:
             raise Exception("Email is required for creating leads")
-        response = requests.post(
+        response = self.http.post(
             url=self.add_new_lead_ep,
             headers=self.headers,
             data=json.dumps(payload)
@@ -103,7 +122,7 @@ class SierraInteractive:
         message = {
             "message": notes
         }
-        response = requests.post(
+        response = self.http.post(
             url=self.add_note_ep.format(lead_id),
             headers=self.headers,
             data=json.dumps(message)
@@ -113,20 +132,96 @@ class SierraInteractive:
         return response.json()
 
 
-class Five9Custom(Five9):
+def serialize_zeep(value):
+    """
+    Converts a zeep response into dicts and lists walking the objects directly,
+    returns the same structure literal_eval(str(response)) did without printing
+    and parsing the whole response.
+    """
+    values = getattr(value, '__values__', None)
+    if values is not None:
+        return {key: serialize_zeep(item) for key, item in values.items()}
+    if isinstance(value, (list, tuple)):
+        return [serialize_zeep(item) for item in value]
+    if isinstance(value, dict):
+        return {key: serialize_zeep(item) for key, item in value.items()}
+    return value
+
+
+class Five9Custom:
+
+    # max records returned by getContactRecords
+    CONTACT_RECORDS_LIMIT = 1000
 
     def __init__(self, username, password):
-        super().__init__(username, password)
+        # five9 pulls in zeep, import it only when a client is actually built.
+        from five9 import Five9
+        self.username = username
+        self.client = Five9(username, password)
+
+    def __getattr__(self, name):
+        if name == 'client':
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    @property
+    def configuration(self):
+        return self.client.configuration
 
     def search_contacts(self, criteria):
         response = self.configuration.getContactRecords(
             lookupCriteria=criteria)
-        return literal_eval(str(response))
+        return serialize_zeep(response)
+
+    def iter_contacts(self, criteria, split_field='number1', prefix='', truncation=None):
+        """
+        Yields the result of a contact search as (fields, records) pages.
+        getContactRecords returns at most 1000 records, when a query reaches the
+        limit it is split into 10 narrower queries adding a wildcard criteria
+        on the next digit of split_field, so at most one page is held in memory.
+        The split relies on getContactRecords matching a "<prefix>*" value as a
+        wildcard, when the narrower queries return nothing it is reported as
+        truncation instead of returning an empty result.
+        :param dict criteria: the lookupCriteria of the search.
+        :param str split_field: a field of the contacts that is not part of the criteria.
+        :param list truncation: optional list the reasons the result may be
+        incomplete are appended to, e.g. records with an empty split_field are
+        not returned by the narrower queries.
+        """
+        if truncation is None:
+            truncation = []
+        query = criteria
+        if prefix:
+            query = dict(criteria, criteria=criteria['criteria'] + [
+                {'field': split_field, 'value': f"{prefix}*"}])
+        contacts = self.search_contacts(query)
+        if contacts is None or not contacts['records']:
+            return
+        if len(contacts['records']) < Five9Custom.CONTACT_RECORDS_LIMIT:
+            yield contacts['fields'], contacts['records']
+            return
+        if len(prefix) >= 10:
+            truncation.append(
+                f"Search with {split_field} {prefix} returned the maximum of {Five9Custom.CONTACT_RECORDS_LIMIT} records.")
+            yield contacts['fields'], contacts['records']
+            return
+        del contacts
+        if not prefix:
+            truncation.append(
+                f"Search reached the maximum of {Five9Custom.CONTACT_RECORDS_LIMIT} records and was split on {split_field}, records with an empty {split_field} are not included.")
+        found = False
+        for digit in "0123456789":
+            for page in self.iter_contacts(criteria, split_field, prefix + digit, truncation):
+                found = True
+                yield page
+        if not found:
+            truncation.append(
+                f"Wildcard searches on {split_field} {prefix}* returned no records, getContactRecords may not support them.")
 
     def get_campaign_profile(self, profile_name):
         response = self.configuration.getCampaignProfiles(
             namePattern=profile_name)
-        return literal_eval(str(response[0]))
+        return serialize_zeep(response[0])
 
     def update_campaign_profile(self, profile_confing):
         return self.configuration.modifyCampaignProfile(profile_confing)
@@ -134,13 +229,13 @@ class Five9Custom(Five9):
     def get_inbound_campaigns(self, name_pattern=None):
         response = self.configuration.getCampaigns(
             campaignNamePattern=".*" if name_pattern is None else name_pattern, campaignType="INBOUND")
-        return literal_eval(str(response))
+        return serialize_zeep(response)
 
     def get_outbound_campaigns(self, name_pattern=None):
         response = self.configuration.getCampaigns(
             campaignNamePattern=".*" if name_pattern is None else name_pattern, campaignType="OUTBOUND"
         )
-        return literal_eval(str(response))
+        return serialize_zeep(response)
 
     def update_dnis_list(self, campaign_name: str, dnis_list: list):
         return self.configuration.addDNISToCampaign(
@@ -160,9 +255,207 @@ class Five9Custom(Five9):
     def remove_from_dnc(self, numbers: list):
         return self.configuration.removeNumbersFromDnc(numbers)
 
+
+class DncWriter:
+
+    """
+    Batches the numbers added to the Five9 DNC list.
+    Numbers added by concurrent jobs within flush_interval are sent together in
+    chunks of chunk_size, numbers already sent within dedupe_window are skipped
+    and numbers already queued by another job wait for that send.
+    A chunk Five9 answers with a fault is split in halves to find the numbers
+    it rejects, other errors are retried and then fail the whole chunk, so every
+    report lists the accepted and rejected numbers.
+    :param Five9Custom client: the client used to call addNumbersToDnc.
+    :param int chunk_size: max numbers per addNumbersToDnc call.
+    :param float flush_interval: seconds numbers wait for other jobs, 0 sends them right away.
+    :param float dedupe_window: seconds a number already sent is skipped.
+    :param int retries: retries of a chunk that failed with an error other than a fault.
+    """
+
+    def __init__(self, client, chunk_size: int = 100, flush_interval: float = 0.5,
+                 dedupe_window: float = 3600, retries: int = 2) -> None:
+        self.client = client
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.sent = TTLCache(maxsize=100000, ttl=dedupe_window)
+        self.pending = []
+        # number -> future of the batch it is queued in
+        self.queued = {}
+        self.batch = Future()
+        self.flush_timer = None
+        self.lock = threading.Lock()
+
+    def add(self, numbers: list) -> list:
+        """
+        Queues the numbers and waits until they are sent.
+        :return the reports of the chunks that contain the numbers,
+        [{'numbers': list, 'accepted': list, 'rejected': list, 'errors': list}]
+        """
+        batches = []
+        flush_now = False
+        with self.lock:
+            for number in numbers:
+                if str(number) in self.sent:
+                    continue
+                batch = self.queued.get(str(number))
+                if batch is None:
+                    batch = self.batch
+                    self.queued[str(number)] = batch
+                    self.pending.append(number)
+                if batch not in batches:
+                    batches.append(batch)
+            if self.batch in batches:
+                flush_now = self.flush_interval <= 0
+                if not flush_now and self.flush_timer is None:
+                    self.flush_timer = threading.Timer(self.flush_interval, self.flush)
+                    self.flush_timer.daemon = True
+                    self.flush_timer.start()
+        if flush_now:
+            self.flush()
+        job_numbers = {str(number) for number in numbers}
+        return [report for batch in batches for report in batch.result()
+                if job_numbers.intersection(str(number) for number in report['numbers'])]
+
+    def flush(self) -> None:
+        with self.lock:
+            numbers, self.pending = self.pending, []
+            batch, self.batch = self.batch, Future()
+            self.flush_timer = None
+        reports = []
+        try:
+            for start in range(0, len(numbers), self.chunk_size):
+                chunk = numbers[start:start + self.chunk_size]
+                report = {'numbers': chunk, 'accepted': [], 'rejected': [], 'errors': []}
+                self.send(chunk, self.retries, report)
+                reports.append(report)
+        finally:
+            with self.lock:
+                for number in numbers:
+                    if self.queued.get(str(number)) is batch:
+                        del self.queued[str(number)]
+            batch.set_result(reports)
+
+    def send(self, numbers: list, retries: int, report: dict) -> None:
+        from zeep.exceptions import Fault
+        for attempt in range(retries + 1):
+            try:
+                self.client.add_to_dnc(numbers)
+                for number in numbers:
+                    self.sent.set(str(number), True)
+                report['accepted'] += numbers
+                return
+            except Fault as error:
+                fault = error
+                break
+            except Exception as error:
+                if attempt < retries:
+                    time.sleep(0.5 * 2 ** attempt)
+                    continue
+                # transport and service errors are not caused by the numbers,
+                # splitting the chunk would only multiply the calls
+                report['rejected'] += numbers
+                report['errors'].append(str(error))
+                return
+        if len(numbers) == 1:
+            report['rejected'] += numbers
+            report['errors'].append(str(fault))
+            return
+        # adding a number twice is harmless, so halves can be retried safely
+        middle = len(numbers) // 2
+        self.send(numbers[:middle], 0, report)
+        self.send(numbers[middle:], 0, report)
+
+
+class DnisSwapExecutor:
+
+    """
+    Replaces a DNIS with another one on several inbound campaigns concurrently.
+    Every applied step is recorded in a journal, when a campaign fails the
+    applied steps are undone in reverse order and DnisSwapError is raised with
+    the journal, which can also be passed back to swap to resume instead.
+    :param Five9Custom client: the client used to update the campaigns.
+    :param int max_workers: max campaigns updated at the same time.
+    """
+
+    def __init__(self, client, max_workers: int = 4) -> None:
+        self.client = client
+        self.max_workers = max_workers
+
+    def swap(self, campaigns: list, old_dnis: str, new_dnis: str, rollback: bool = True, journal: list = None) -> list:
+        """
+        :param list journal: journal of a previous call, steps applied and not rolled back are skipped.
+        :return the journal, [{'campaign': str, 'action': 'remove' | 'add', 'dnis': str}]
+        """
+        journal = [] if journal is None else journal
+        applied = {(step['campaign'], step['action'])
+                   for step in journal if not step.get('rolled_back')}
+        lock = threading.Lock()
+        errors = {}
+
+        def run(campaign):
+            for action, dnis in [('remove', old_dnis), ('add', new_dnis)]:
+                if (campaign, action) in applied:
+                    continue
+                self.apply(campaign, action, dnis)
+                with lock:
+                    journal.append(
+                        {'campaign': campaign, 'action': action, 'dnis': dnis})
+
+        if campaigns:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(campaigns))) as executor:
+                futures = {executor.submit(run, campaign): campaign for campaign in campaigns}
+                for future in as_completed(futures):
+                    if future.exception() is not None:
+                        errors[futures[future]] = str(future.exception())
+        if errors:
+            if rollback:
+                self.rollback(journal)
+            raise DnisSwapError(errors, journal)
+        return journal
+
+    def rollback(self, journal: list) -> None:
+        for step in reversed(journal):
+            try:
+                self.apply(step['campaign'],
+                           'add' if step['action'] == 'remove' else 'remove', step['dnis'])
+                step['rolled_back'] = True
+            except Exception as error:
+                step['rollback_error'] = str(error)
+
+    def apply(self, campaign: str, action: str, dnis: str):
+        if action == 'remove':
+            return self.client.remove_dnis_list(campaign, [dnis])
+        return self.client.update_dnis_list(campaign, [dnis])
+
+
+dnc_writers = {}
+dnc_writers_lock = threading.Lock()
+
+
+def get_dnc_writer(client) -> DncWriter:
+    """
+    Returns the DncWriter shared by every job using the Five9 user of client.
+    """
+    with dnc_writers_lock:
+        writer = dnc_writers.get(client.username)
+        if writer is None:
+            writer = DncWriter(
+                client,
+                chunk_size=int(os.environ.get('DNC_CHUNK_SIZE', 100)),
+                flush_interval=float(os.environ.get('DNC_FLUSH_INTERVAL', 0.5)),
+                dedupe_window=float(os.environ.get('DNC_DEDUPE_WINDOW', 3600))
+            )
+            dnc_writers[client.username] = writer
+        writer.client = client
+    return writer
+
+
 class KvCore:
 
     def __init__(self, api_token) -> None:
+        self.http = http_transport
         self.headers = {
             "Authorization": f"Bearer {api_token}",
             "Content-Type": "application/json"
@@ -173,7 +466,7 @@ class KvCore:
     def get_contact(self, email):
         if not email:
             return None
-        response = requests.get(
+        response = self.http.get(
             url=self.get_contacts_list_ep.format("email", email),
             headers=self.headers
         )
@@ -191,7 +484,7 @@ class KvCore:
             "title": title,
             "details": notes
         })
-        response = requests.put(
+        response = self.http.put(
             url=self.add_note_ep.format(contact_id),
             headers=self.headers,
             data=payload
@@ -201,6 +494,65 @@ class KvCore:
         raise ApiError(response.status_code)
 
 
+class SQLPoolMetrics:
+
+    def __init__(self) -> None:
+        self.counts = {'connects': 0, 'checkouts': 0, 'checkins': 0}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        def listener(*args):
+            with self.lock:
+                self.counts[name] += 1
+        return listener
+
+
+# SQLAlchemy engines keyed by connection string and pool options.
+sql_engines = {}
+sql_engines_metrics = {}
+sql_engines_lock = threading.Lock()
+
+
+def get_sql_engine(conn_string: str, pool_size: int = 5, pool_recycle: int = 1800, pool_pre_ping: bool = True):
+    """
+    Returns the engine of conn_string shared by every SQLDB of the instance,
+    so its pooled connections survive between jobs.
+    :param int pool_recycle: seconds after which a pooled connection is replaced,
+    it should be lower than the wait_timeout of the server.
+    :param bool pool_pre_ping: test connections before using them.
+    """
+    key = (conn_string, pool_size, pool_recycle, pool_pre_ping)
+    with sql_engines_lock:
+        engine = sql_engines.get(key)
+        if engine is None:
+            from sqlalchemy import create_engine, event
+            engine = create_engine(
+                conn_string,
+                pool_size=pool_size,
+                pool_recycle=pool_recycle,
+                pool_pre_ping=pool_pre_ping
+            )
+            metrics = SQLPoolMetrics()
+            for name, event_name in [('connects', 'connect'), ('checkouts', 'checkout'), ('checkins', 'checkin')]:
+                event.listen(engine, event_name, metrics.count(name))
+            sql_engines[key] = engine
+            sql_engines_metrics[key] = metrics
+    return engine
+
+
+def get_sql_pool_metrics() -> dict:
+    """
+    Returns the pool counters of every engine keyed by its url without the password.
+    """
+    metrics = {}
+    for key, engine in list(sql_engines.items()):
+        metrics[repr(engine.url)] = dict(
+            sql_engines_metrics[key].counts,
+            status=engine.pool.status()
+        )
+    return metrics
+
+
 class SQLDB:
 
     def __init__(self, db_credentials) -> None:
@@ -212,7 +564,16 @@ class SQLDB:
             schema=self.db_credentials['schema'],
             conn_string=self.db_credentials['conn_string'],
         )
-        self.engine = create_engine(self.conn_string)
+        self.engine = get_sql_engine(
+            self.conn_string,
+            pool_size=int(self.db_credentials.get(
+                'pool_size', os.environ.get('SQL_POOL_SIZE', 5))),
+            pool_recycle=int(self.db_credentials.get(
+                'pool_recycle', os.environ.get('SQL_POOL_RECYCLE', 1800))),
+            # credentials may come from JSON or strings, bool("false") would be True
+            pool_pre_ping=str(self.db_credentials.get('pool_pre_ping', True)).strip().lower()
+            not in ('false', '0', 'no', 'off', '')
+        )
 
     def execute_sql(self, query_string, multiparams=None):
         if self.engine is None:
@@ -237,6 +598,7 @@ class GHL:
         self.agency_api_key = agency_api_key
         self.location_id = location_id
         self.location_api_key = None
+        self.http = http_transport
         self.get_location_ep = f'https://rest.gohighlevel.com/v1/locations/{self.location_id}'
         self.contact_ep = 'https://rest.gohighlevel.com/v1/contacts/{}'
         self.contact_lookup_ep = 'https://rest.gohighlevel.com/v1/contacts/lookup?'
@@ -249,20 +611,52 @@ class GHL:
         headers = {
             'Authorization': f'Bearer {self.agency_api_key}'
         }
-        request = requests.get(url=self.get_location_ep,
-                               headers=headers, data={})
+        request = self.http.get(url=self.get_location_ep,
+                                headers=headers, data={})
         if request.status_code == 200:
             return request.json()
         raise ApiError(400)
 
-    def get_custom_fields(self):
-        custom_fields_data = []
-        self.location_api_key = self.get_location(
-        )['apiKey'] if self.location_api_key is None else self.location_api_key
+    def get_location_api_key(self):
+        """
+        Returns the location API key, shared by every GHL instance of the same
+        agency key and location so get_location is only called once per TTL.
+        """
+        if self.location_api_key is None:
+            self.location_api_key = location_key_cache.get_or_create(
+                (self.agency_api_key, self.location_id),
+                lambda: self.get_location()['apiKey']
+            )
+        return self.location_api_key
+
+    def invalidate_location_api_key(self):
+        location_key_cache.pop((self.agency_api_key, self.location_id))
+        self.location_api_key = None
+
+    def location_request(self, method, url, data=None):
+        """
+        Sends a request authenticated with the location API key, a 401 response
+        drops the cached key and the request is retried once with a fresh one.
+        """
+        response = self.http.request(
+            method, url, headers=self.location_headers(data), data=data)
+        if response.status_code == 401:
+            self.invalidate_location_api_key()
+            response = self.http.request(
+                method, url, headers=self.location_headers(data), data=data)
+        return response
+
+    def location_headers(self, data=None):
         headers = {
-            'Authorization': f'Bearer {self.location_api_key}'
+            'Authorization': f'Bearer {self.get_location_api_key()}'
         }
-        response = requests.get(url=self.custom_fields_ep, headers=headers)
+        if data is not None:
+            headers['Content-Type'] = 'application/json'
+        return headers
+
+    def get_custom_fields(self):
+        custom_fields_data = []
+        response = self.location_request('GET', self.custom_fields_ep)
         if response.status_code != 200:
             raise ApiError(response.status_code)
         if 'customFields' in response.json():
@@ -271,15 +665,52 @@ class GHL:
             return None
         return custom_fields_data['customFields']
 
+    def get_custom_fields_index(self):
+        """
+        Returns the cached custom fields of the location as a dict of
+        field key (without the contact. prefix) -> custom field id.
+        """
+        return metadata_cache.get(
+            f'ghl_{self.location_id}_custom_fields', self.get_custom_fields,
+            GHL.index_custom_fields)
+
+    def get_pipelines_index(self):
+        """
+        Returns the cached pipelines of the location as a dict of
+        pipeline name -> {'pipeline': dict, 'stages': {stage name: position}}.
+        """
+        return metadata_cache.get(
+            f'ghl_{self.location_id}_pipelines', self.get_pipelines,
+            GHL.index_pipelines)
+
+    def invalidate_metadata(self, name=None):
+        for metadata in ['custom_fields', 'pipelines'] if name is None else [name]:
+            metadata_cache.invalidate(f'ghl_{self.location_id}_{metadata}')
+
+    @classmethod
+    def index_custom_fields(cls, custom_fields):
+        index = {}
+        for field in custom_fields or []:
+            index.setdefault(field['fieldKey'].split(".")[1], field['id'])
+        return index
+
+    @classmethod
+    def index_pipelines(cls, pipelines):
+        index = {}
+        for pipeline in pipelines or []:
+            stages = {}
+            for position, stage in enumerate(pipeline['stages']):
+                stages.setdefault(stage['name'], position)
+            index.setdefault(pipeline['name'], {
+                'pipeline': pipeline,
+                'stages': stages
+            })
+        return index
+
     def contact_lookup(self, query_params):
         contact_data = []
-        self.location_api_key = self.get_location(
-        )['apiKey'] if self.location_api_key is None else self.location_api_key
-        headers = {
-            'Authorization': f'Bearer {self.location_api_key}'
-        }
         url = self.contact_lookup_ep + query_params
-        response = requests.get(url=url, headers=headers)
+        response = self.location_request('GET', url)
         if response.status_code != 200:
             if response.status_code == 422:
                 return None
@@ -292,15 +723,9 @@ class GHL:
 
     def update_contact(self, contact_id, data):
         contact_data = []
-        self.location_api_key = self.get_location(
-        )['apiKey'] if self.location_api_key is None else self.location_api_key
-        headers = {
-            'Authorization': f'Bearer {self.location_api_key}',
-            'Content-Type': 'application/json'
-        }
         url = self.contact_ep.format(contact_id)
         payload = json.dumps(data)
-        response = requests.put(url=url, headers=headers, data=payload)
+        response = self.location_request('PUT', url, payload)
         if response.status_code != 200:
             raise ApiError(response.status_code)
         contact_data = response.json()
@@ -308,18 +733,12 @@ class GHL:
 
     def add_notes(self, contact_id, notes, user_id):
         notes_data = []
-        self.location_api_key = self.get_location(
-        )['apiKey'] if self.location_api_key is None else self.location_api_key
-        headers = {
-            'Authorization': f'Bearer {self.location_api_key}',
-            'Content-Type': 'application/json'
-        }
         url = self.notes_ep.format(contact_id)
         payload = json.dumps({
             "body": notes,
             "userID": user_id
         })
-        response = requests.post(url=url, headers=headers, data=payload)
+        response = self.location_request('POST', url, payload)
         if response.status_code != 200:
             raise ApiError(response.status_code)
         notes_data = response.json()
@@ -327,11 +746,8 @@ class GHL:
 
     def get_pipelines(self):
         pipelines_data = []
-        self.location_api_key = self.get_location(
-        )['apiKey'] if self.location_api_key is None else self.location_api_key
-        headers = { 'Authorization': f'Bearer {self.location_api_key}' }
         url = self.pipelines_ep
-        response = requests.get(url=url, headers=headers)
+        response = self.location_request('GET', url)
         if response.status_code != 200:
             raise ApiError(response.status_code)
         if 'pipelines' in response.json():
@@ -342,11 +758,8 @@ class GHL:
 
     def get_opportunities(self, pipeline_id, query_params=None):
         opportunities_data = []
-        self.location_api_key = self.get_location(
-        )['apiKey'] if self.location_api_key is None else self.location_api_key
-        headers = { 'Authorization': f'Bearer {self.location_api_key}' }
         url = self.opportunities_ep.format(pipeline_id) + '?query=' + query_params if query_params else self.opportunities_ep.format(pipeline_id)
-        response = requests.get(url=url, headers=headers)
+        response = self.location_request('GET', url)
         if response.status_code != 200:
             raise ApiError(response.status_code)
         if 'opportunities' in response.json():
@@ -357,15 +770,9 @@ class GHL:
 
     def create_opportunity(self, pipeline_id, data):
         opportunity_data = []
-        self.location_api_key = self.get_location(
-        )['apiKey'] if self.location_api_key is None else self.location_api_key
-        headers = {
-            'Authorization': f'Bearer {self.location_api_key}',
-            'Content-Type': 'application/json'
-        }
         url = self.opportunities_ep.format(pipeline_id) + '/'
         payload = json.dumps(data)
-        response = requests.post(url=url, headers=headers, data=payload)
+        response = self.location_request('POST', url, payload)
         if response.status_code != 200:
             raise ApiError(response.status_code)
         opportunity_data = response.json()
@@ -373,16 +780,10 @@ class GHL:
 
     def update_opportunity(self, pipeline_id, opportunity_id, data):
         opportunity_data = []
-        self.location_api_key = self.get_location(
-        )['apiKey'] if self.location_api_key is None else self.location_api_key
-        headers = {
-            'Authorization': f'Bearer {self.location_api_key}',
-            'Content-Type': 'application/json'
-        }
         url = self.opportunities_ep.format(pipeline_id) + '/' + str(opportunity_id)
         payload = json.dumps(data)
-        response = requests.put(url=url, headers=headers, data=payload)
+        response = self.location_request('PUT', url, payload)
         if response.status_code != 200:
             raise ApiError(response.status_code)
         opportunity_data = response.json()
-        return opportunity_data
\ No newline at end of file
+        return opportunity_data
@@ -0,0 +1,247 @@
+import json
+from .apps import SierraInteractive, KvCore, GHL, location_key_cache, metadata_cache
+from .exceptions import ApiError
+from .transport import async_http_transport
+
+
+class AsyncSierraInteractive(SierraInteractive):
+
+    """
+    asyncio version of SierraInteractive, the methods are coroutines with the
+    same arguments and results. Requires the async extra (aiohttp).
+    """
+
+    def __init__(self, api_key: str, originating_system: str) -> None:
+        super().__init__(api_key, originating_system)
+        self.http = async_http_transport
+
+    async def find_leads(self, lead_phone: str, lead_email: str):
+        if not lead_email:
+            response = await self.http.get(
+                self.find_leads_ep.format(f'phone={lead_phone.strip()}'),
+                headers=self.headers
+            )
+            if response.status_code != 200:
+                raise ApiError(response.status_code)
+            json_response = response.json()
+            if json_response['data']['totalRecords'] > 0:
+                return json_response['data']['leads'][0]
+            return None
+        response = await self.http.get(
+            self.retrieve_lead_details_ep.format(lead_email.strip()),
+            headers=self.headers
+        )
+        if response.json()['success'] == True:
+            return response.json()['data']
+        return None
+
+    async def add_new_lead(self, payload: dict):
+        if not payload['email']:
+            raise Exception("Email is required for creating leads")
+        response = await self.http.post(
+            url=self.add_new_lead_ep,
+            headers=self.headers,
+            data=json.dumps(payload)
+        )
+        if response.status_code != 200:
+            raise ApiError(response.status_code)
+        return response.json()['data']
+
+    async def add_note(self, lead_id: str, notes: str):
+        message = {
+            "message": notes
+        }
+        response = await self.http.post(
+            url=self.add_note_ep.format(lead_id),
+            headers=self.headers,
+            data=json.dumps(message)
+        )
+        if response.status_code != 200:
+            raise ApiError(response.status_code)
+        return response.json()
+
+
+class AsyncKvCore(KvCore):
+
+    """
+    asyncio version of KvCore. Requires the async extra (aiohttp).
+    """
+
+    def __init__(self, api_token) -> None:
+        super().__init__(api_token)
+        self.http = async_http_transport
+
+    async def get_contact(self, email):
+        if not email:
+            return None
+        response = await self.http.get(
+            url=self.get_contacts_list_ep.format("email", email),
+            headers=self.headers
+        )
+        if response.status_code != 200:
+            raise ApiError(
+                response.status_code
+            )
+        json_data = response.json()
+        if json_data['total'] > 0:
+            return json_data['data'][0]
+        return None
+
+    async def update_notes(self, contact_id, title, notes):
+        payload = json.dumps({
+            "title": title,
+            "details": notes
+        })
+        response = await self.http.put(
+            url=self.add_note_ep.format(contact_id),
+            headers=self.headers,
+            data=payload
+        )
+        if response.status_code == 200:
+            return response.json()
+        raise ApiError(response.status_code)
+
+
+class AsyncGHL(GHL):
+
+    """
+    asyncio version of GHL, it shares the location key and metadata caches
+    with GHL. Requires the async extra (aiohttp).
+    """
+
+    def __init__(self, agency_api_key, location_id) -> None:
+        super().__init__(agency_api_key, location_id)
+        self.http = async_http_transport
+
+    async def get_location(self):
+        headers = {
+            'Authorization': f'Bearer {self.agency_api_key}'
+        }
+        request = await self.http.get(url=self.get_location_ep, headers=headers)
+        if request.status_code == 200:
+            return request.json()
+        raise ApiError(400)
+
+    async def get_location_api_key(self):
+        if self.location_api_key is None:
+            async def get_api_key():
+                return (await self.get_location())['apiKey']
+
+            self.location_api_key = await location_key_cache.get_or_create_async(
+                (self.agency_api_key, self.location_id), get_api_key)
+        return self.location_api_key
+
+    async def location_request(self, method, url, data=None):
+        response = await self.http.request(
+            method, url, headers=await self.location_headers(data), data=data)
+        if response.status_code == 401:
+            self.invalidate_location_api_key()
+            response = await self.http.request(
+                method, url, headers=await self.location_headers(data), data=data)
+        return response
+
+    async def location_headers(self, data=None):
+        headers = {
+            'Authorization': f'Bearer {await self.get_location_api_key()}'
+        }
+        if data is not None:
+            headers['Content-Type'] = 'application/json'
+        return headers
+
+    async def get_custom_fields(self):
+        custom_fields_data = []
+        response = await self.location_request('GET', self.custom_fields_ep)
+        if response.status_code != 200:
+            raise ApiError(response.status_code)
+        if 'customFields' in response.json():
+            custom_fields_data = response.json()
+        if len(custom_fields_data) == 0:
+            return None
+        return custom_fields_data['customFields']
+
+    async def get_custom_fields_index(self):
+        return await metadata_cache.get_async(
+            f'ghl_{self.location_id}_custom_fields', self.get_custom_fields,
+            GHL.index_custom_fields)
+
+    async def get_pipelines_index(self):
+        return await metadata_cache.get_async(
+            f'ghl_{self.location_id}_pipelines', self.get_pipelines,
+            GHL.index_pipelines)
+
+    async def contact_lookup(self, query_params):
+        contact_data = []
+        url = self.contact_lookup_ep + query_params
+        response = await self.location_request('GET', url)
+        if response.status_code != 200:
+            if response.status_code == 422:
+                return None
+            raise ApiError(response.status_code)
+        if 'contacts' in response.json():
+            contact_data = response.json()['contacts']
+        if len(contact_data) == 0:
+            return None
+        return contact_data[0]
+
+    async def update_contact(self, contact_id, data):
+        url = self.contact_ep.format(contact_id)
+        response = await self.location_request('PUT', url, json.dumps(data))
+        if response.status_code != 200:
+            raise ApiError(response.status_code)
+        return response.json()
+
+    async def add_notes(self, contact_id, notes, user_id):
+        url = self.notes_ep.format(contact_id)
+        payload = json.dumps({
+            "body": notes,
+            "userID": user_id
+        })
+        response = await self.location_request('POST', url, payload)
+        if response.status_code != 200:
+            raise ApiError(response.status_code)
+        return response.json()
+
+    async def get_pipelines(self):
+        pipelines_data = []
+        response = await self.location_request('GET', self.pipelines_ep)
+        if response.status_code != 200:
+            raise ApiError(response.status_code)
+        if 'pipelines' in response.json():
+            pipelines_data = response.json()['pipelines']
+        if len(pipelines_data) == 0:
+            return None
+        return pipelines_data
+
+    async def get_opportunities(self, pipeline_id, query_params=None):
+        opportunities_data = []
+        url = self.opportunities_ep.format(pipeline_id) + '?query=' + query_params if query_params else self.opportunities_ep.format(pipeline_id)
+        response = await self.location_request('GET', url)
+        if response.status_code != 200:
+            raise ApiError(response.status_code)
+        if 'opportunities' in response.json():
+            opportunities_data = response.json()['opportunities']
+        if len(opportunities_data) == 0:
+            return None
+        return opportunities_data
+
+    async def create_opportunity(self, pipeline_id, data):
+        url = self.opportunities_ep.format(pipeline_id) + '/'
+        response = await self.location_request('POST', url, json.dumps(data))
+        if response.status_code != 200:
+            raise ApiError(response.status_code)
+        return response.json()
+
+    async def update_opportunity(self, pipeline_id, opportunity_id, data):
+        url = self.opportunities_ep.format(pipeline_id) + '/' + str(opportunity_id)
+        response = await self.location_request('PUT', url, json.dumps(data))
+        if response.status_code != 200:
+            raise ApiError(response.status_code)
+        return response.json()
+
+
+# async client of each app, used by AbstractService.get_async_app_instance
+ASYNC_APPS = {
+    SierraInteractive: AsyncSierraInteractive,
+    KvCore: AsyncKvCore,
+    GHL: AsyncGHL
+}
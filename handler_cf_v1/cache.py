@@ -0,0 +1,298 @@
+from collections import OrderedDict
+import asyncio
+import os
+import threading
+import time
+
+
+def freeze(value):
+    # Turns dicts and lists (e.g. db_credentials) into hashable tuples.
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class TTLCache:
+
+    """
+    In process cache with per entry expiration and least recently used eviction.
+    :param int maxsize: the max number of entries kept, the least recently used entry is evicted first.
+    :param float ttl: seconds an entry is valid after being set.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 600) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        # per key locks and tasks of the get_or_create calls in progress
+        self.creating = {}
+        self.pending = {}
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None) -> None:
+        with self.lock:
+            self.entries[key] = (
+                time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def get_or_create(self, key, factory, ttl: float = None):
+        """
+        Returns the cached value of key, calling factory when it is missing.
+        Concurrent calls for the same key wait for a single factory call.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self.lock:
+            key_lock = self.creating.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                value = self.get(key)
+                if value is None:
+                    value = factory()
+                    self.set(key, value, ttl)
+                return value
+        finally:
+            with self.lock:
+                if self.creating.get(key) is key_lock:
+                    del self.creating[key]
+
+    async def get_or_create_async(self, key, factory, ttl: float = None):
+        """
+        Same as get_or_create for a coroutine function factory, concurrent
+        tasks of the running loop wait for a single factory call.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        pending_key = (asyncio.get_running_loop(), key)
+        task = self.pending.get(pending_key)
+        if task is None:
+            async def create():
+                try:
+                    value = await factory()
+                    self.set(key, value, ttl)
+                    return value
+                finally:
+                    self.pending.pop(pending_key, None)
+
+            task = asyncio.ensure_future(create())
+            self.pending[pending_key] = task
+        # a cancelled caller doesn't cancel the call the other tasks wait for
+        return await asyncio.shield(task)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class ClientPool:
+
+    """
+    Keeps app clients alive between invocations of a warm instance.
+    Clients are keyed by app class and the arguments used to build them,
+    so two jobs with the same credentials share the same client.
+    """
+
+    def __init__(self, maxsize: int = 32, ttl: float = 1800) -> None:
+        self.clients = TTLCache(maxsize, ttl)
+
+    def get(self, app, *args, **kwargs):
+        return self.clients.get_or_create(
+            self.client_key(app, args, kwargs), lambda: app(*args, **kwargs))
+
+    def discard(self, app, *args, **kwargs) -> None:
+        self.clients.pop(self.client_key(app, args, kwargs))
+
+    def clear(self) -> None:
+        self.clients.clear()
+
+    @classmethod
+    def client_key(cls, app, args: tuple, kwargs: dict) -> tuple:
+        return (app, freeze(args), freeze(kwargs))
+
+
+client_pool = ClientPool(
+    maxsize=int(os.environ.get('CLIENT_POOL_SIZE', 32)),
+    ttl=float(os.environ.get('CLIENT_POOL_TTL', 1800))
+)
+
+
+class FirestoreBackend:
+
+    """
+    Stores cache entries as documents of a Firestore collection so cold
+    instances can warm up from entries written by other instances.
+    :param str collection: the collection used to store the entries.
+    :param str project: the GCP project, defaults to the project of the environment.
+    """
+
+    def __init__(self, collection: str, project: str = None) -> None:
+        self.collection = collection
+        self.project = project
+        self.db = None
+
+    def document(self, key: str):
+        if self.db is None:
+            from google.cloud import firestore
+            self.db = firestore.Client(self.project)
+        return self.db.collection(self.collection).document(key.replace("/", "_"))
+
+    def get(self, key: str):
+        doc = self.document(key).get()
+        if not doc.exists:
+            return None
+        entry = doc.to_dict()
+        return entry['stored_at'], entry['value']
+
+    def set(self, key: str, value, stored_at: float) -> None:
+        self.document(key).set({'stored_at': stored_at, 'value': value})
+
+    def delete(self, key: str) -> None:
+        self.document(key).delete()
+
+
+class MetadataCache:
+
+    """
+    Cache for slow changing data (e.g. GHL custom fields and pipelines).
+    Entries older than ttl are still returned for stale_ttl more seconds while
+    they are refreshed in a background thread, after that they are loaded again
+    before returning. Entries live in process memory and, when a backend is
+    given, in the backend too.
+    :param backend: optional persistent store, e.g. FirestoreBackend.
+    :param float ttl: seconds an entry is fresh.
+    :param float stale_ttl: seconds a stale entry can still be served.
+    """
+
+    def __init__(self, backend=None, ttl: float = 300, stale_ttl: float = 3600) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.entries = {}
+        self.indexes = {}
+        self.refreshing = set()
+        self.tasks = set()
+        self.lock = threading.Lock()
+
+    def get(self, key: str, loader, build=None):
+        """
+        Returns the cached value of key, calling loader when it is missing or expired.
+        :param build: optional function applied to the value, its result is kept
+        until the value changes so indexes are only built once per refresh.
+        """
+        entry = self.load_entry(key)
+        age = None if entry is None else time.time() - entry[0]
+        if age is None or age > self.ttl + self.stale_ttl:
+            entry = self.refresh(key, loader)
+        elif age > self.ttl:
+            self.refresh_in_background(key, loader)
+        return self.build_index(key, entry, build)
+
+    async def get_async(self, key: str, loader, build=None):
+        """
+        Same as get for a coroutine function loader, stale entries are
+        refreshed in a task of the running loop instead of a thread.
+        """
+        entry = self.load_entry(key)
+        age = None if entry is None else time.time() - entry[0]
+        if age is None or age > self.ttl + self.stale_ttl:
+            entry = self.store(key, await loader())
+        elif age > self.ttl:
+            with self.lock:
+                refreshing = key in self.refreshing
+                self.refreshing.add(key)
+            if not refreshing:
+                async def run():
+                    try:
+                        self.store(key, await loader())
+                    except Exception:
+                        # The stale entry is kept and the next get will try again.
+                        pass
+                    finally:
+                        with self.lock:
+                            self.refreshing.discard(key)
+
+                # the loop only keeps weak references to tasks
+                task = asyncio.get_running_loop().create_task(run())
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+        return self.build_index(key, entry, build)
+
+    def load_entry(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None and self.backend is not None:
+            entry = self.backend.get(key)
+            if entry is not None:
+                self.entries[key] = entry
+        return entry
+
+    def build_index(self, key: str, entry: tuple, build=None):
+        if build is None:
+            return entry[1]
+        index = self.indexes.get(key)
+        if index is None or index[0] != entry[0]:
+            index = (entry[0], build(entry[1]))
+            self.indexes[key] = index
+        return index[1]
+
+    def refresh(self, key: str, loader) -> tuple:
+        return self.store(key, loader())
+
+    def store(self, key: str, value) -> tuple:
+        entry = (time.time(), value)
+        self.entries[key] = entry
+        if self.backend is not None:
+            self.backend.set(key, entry[1], entry[0])
+        return entry
+
+    def refresh_in_background(self, key: str, loader) -> None:
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def run():
+            try:
+                self.refresh(key, loader)
+            except Exception:
+                # The stale entry is kept and the next get will try again.
+                pass
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def invalidate(self, key: str) -> None:
+        self.entries.pop(key, None)
+        self.indexes.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(key)
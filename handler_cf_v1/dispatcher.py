@@ -0,0 +1,269 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from datetime import datetime, timedelta, timezone
+import os
+import socket
+import threading
+import uuid
+from . import apps
+from . import services
+from .services import AbstractService, JOB_STATES
+from .transport import async_http_transport
+from .utils import stream_pages, mail_transport
+
+if TYPE_CHECKING:
+    from google.cloud import firestore
+
+
+def build_registry(module, base=None) -> dict:
+    """
+    :return dict of class name -> class for the classes defined in module,
+    limited to subclasses of base when it is given.
+    """
+    return {name: value for name, value in vars(module).items()
+            if isinstance(value, type) and value.__module__ == module.__name__
+            and (base is None or (issubclass(value, base) and value is not base))}
+
+
+# built once per instance, className and appClassName of the service configs
+SERVICE_REGISTRY = build_registry(services, AbstractService)
+APP_REGISTRY = build_registry(apps)
+
+
+class JobDispatcher:
+
+    """
+    Claims queued jobs of a Firestore collection and runs them on a bounded
+    worker pool.
+
+    A job is claimed in a transaction that sets lease_owner and lease_expires,
+    other dispatchers skip it until the lease expires so a job of a stopped
+    instance is picked up again. Failed jobs are queued again with
+    retry_attempt incremented until max_retries, then they are set to error.
+
+    Job data structure
+    {
+        "request": dict,
+        "service_instance": {
+            'className': 'str',
+            'appClassName': 'str',
+            'params': dict
+        },
+        "state_msg": str or dict (depends on state),
+        "retry_attempt": int,
+        "created": datetime,
+        "state": str,
+        # set while the job is claimed
+        "lease_owner": str,
+        "lease_expires": datetime
+    }
+    """
+
+    def __init__(self, db: firestore.Client, collection: str, max_workers: int = 8,
+                 lease_seconds: float = 540, max_retries: int = 3, page_size: int = 50,
+                 worker_id: str = None) -> None:
+        self.db = db
+        self.collection = collection
+        self.max_workers = max_workers
+        self.lease_seconds = lease_seconds
+        self.max_retries = max_retries
+        self.page_size = page_size
+        self.worker_id = worker_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+    def dispatch(self, limit: int = None) -> dict:
+        """
+        Runs the queued jobs, at most limit of them when it is given. A job is
+        only claimed once a worker is free so its lease doesn't run out while
+        it waits in the pool.
+        :return dict of job id -> final state, jobs claimed by another
+        dispatcher are not included.
+        """
+        results = {}
+        submitted = 0
+        slots = threading.BoundedSemaphore(self.max_workers)
+        # notifications of the jobs are queued and sent before the invocation ends
+        with mail_transport.queued(), ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            for page in stream_pages(self.db, self.collection, 'state', "==", JOB_STATES[0],
+                                     page_size=self.page_size):
+                for snapshot in page:
+                    if limit is not None and submitted >= limit:
+                        break
+                    slots.acquire()
+                    try:
+                        job = self.claim(snapshot.id)
+                    except Exception:
+                        slots.release()
+                        raise
+                    if job is None:
+                        slots.release()
+                        continue
+                    future = executor.submit(self.run, snapshot.id, job)
+                    future.add_done_callback(lambda future: slots.release())
+                    futures[snapshot.id] = future
+                    submitted += 1
+                if limit is not None and submitted >= limit:
+                    break
+            for id, future in futures.items():
+                state = future.result()
+                if state is not None:
+                    results[id] = state
+        return results
+
+    def claim(self, id: str) -> dict:
+        """
+        :return the job when the lease was acquired, None when the job is no
+        longer queued or another dispatcher holds a lease on it.
+        """
+        from google.cloud import firestore
+        doc_ref = self.db.collection(self.collection).document(id)
+
+        @firestore.transactional
+        def acquire(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            job = snapshot.to_dict()
+            now = datetime.now(timezone.utc)
+            if not job or job.get('state') != JOB_STATES[0]:
+                return None
+            if job.get('lease_expires') and job['lease_expires'] > now:
+                return None
+            lease = {
+                'lease_owner': self.worker_id,
+                'lease_expires': now + timedelta(seconds=self.lease_seconds)
+            }
+            transaction.update(doc_ref, lease)
+            job.update(lease)
+            return job
+
+        return acquire(self.db.transaction())
+
+    def run(self, id: str, job: dict) -> str:
+        """
+        Runs the service of a claimed job and writes back its state.
+        :return the state of the job, see complete.
+        """
+        error = None
+        try:
+            if job.get('retry_attempt', 0) < self.max_retries:
+                job = self.get_service(job).execute_service() or job
+        except Exception as exception:
+            error = exception
+        return self.complete(id, job, error)
+
+    async def dispatch_async(self, limit: int = None, concurrency: int = 100) -> dict:
+        """
+        Same as dispatch with up to concurrency jobs in flight on the running
+        loop through execute_service_async, Firestore calls run in the default
+        executor since the client is blocking.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = {}
+
+        async def run(id):
+            async with semaphore:
+                job = await loop.run_in_executor(None, self.claim, id)
+                if job is None:
+                    return None
+                try:
+                    if job.get('retry_attempt', 0) < self.max_retries:
+                        job = await self.get_service(job).execute_service_async() or job
+                    error = None
+                except Exception as exception:
+                    error = exception
+                return await loop.run_in_executor(None, self.complete, id, job, error)
+
+        pages = stream_pages(self.db, self.collection, 'state', "==", JOB_STATES[0],
+                             page_size=self.page_size)
+        results = {}
+        # notifications are queued so they don't block the loop, see dispatch
+        mail_transport.start_queueing()
+        try:
+            while limit is None or len(tasks) < limit:
+                page = await loop.run_in_executor(None, next, pages, None)
+                if page is None:
+                    break
+                for snapshot in page[:None if limit is None else limit - len(tasks)]:
+                    tasks[snapshot.id] = loop.create_task(run(snapshot.id))
+            for id, task in tasks.items():
+                state = await task
+                if state is not None:
+                    results[id] = state
+        finally:
+            # the session of this loop can't be reused once the loop ends
+            await async_http_transport.close()
+            await loop.run_in_executor(None, mail_transport.stop_queueing)
+        return results
+
+    def complete(self, id: str, job: dict, error: Exception = None) -> str:
+        """
+        Writes back the state of a job and releases its lease, a failed job is
+        queued again until it reaches max_retries. Nothing is written when the
+        lease was taken over by another dispatcher.
+        :return the state of the job or None when the lease was lost.
+        """
+        from google.cloud import firestore
+        retry_attempt = job.get('retry_attempt', 0)
+        if error is not None:
+            print(f"Job {id} failed: {error}")
+            retry_attempt += 1
+            job['state'] = JOB_STATES[0] if retry_attempt < self.max_retries else JOB_STATES[3]
+            job['state_msg'] = str(error)
+        elif retry_attempt >= self.max_retries:
+            job['state'] = JOB_STATES[3]
+            job['state_msg'] = f"Maximum retry attempts reached: {retry_attempt}"
+        elif job.get('state') not in JOB_STATES[1:]:
+            # the service didn't set a final state, queueing it again would run it forever
+            job['state'] = JOB_STATES[3]
+            job['state_msg'] = f"Service did not set a job state: {job.get('state_msg', '')}"
+        doc_ref = self.db.collection(self.collection).document(id)
+
+        @firestore.transactional
+        def release(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists or snapshot.get('lease_owner') != self.worker_id:
+                return False
+            transaction.update(doc_ref, {
+                'state': job['state'],
+                'state_msg': job.get('state_msg', ""),
+                'retry_attempt': retry_attempt,
+                'updated': datetime.now(timezone.utc),
+                'lease_owner': firestore.DELETE_FIELD,
+                'lease_expires': firestore.DELETE_FIELD
+            })
+            return True
+
+        if not release(self.db.transaction()):
+            print(f"Job {id} lease was taken over by another dispatcher, state not saved")
+            return None
+        return job['state']
+
+    @classmethod
+    def get_service(cls, job: dict) -> AbstractService:
+        config = job['service_instance']
+        try:
+            service = SERVICE_REGISTRY[config['className']]
+            app = APP_REGISTRY[config['appClassName']]
+        except KeyError as error:
+            raise ValueError(f"Unknown service or app class: {error}")
+        return service(config, job, app)
+
+
+def dispatch_queued_jobs(project: str = None, collection: str = None, limit: int = None) -> dict:
+    """
+    Runs the queued jobs of collection with a dispatcher configured from the
+    DISPATCHER_* environment variables, e.g. as the body of a scheduled function.
+    """
+    from google.cloud import firestore
+    db = firestore.Client(project or os.environ.get('DISPATCHER_PROJECT'))
+    dispatcher = JobDispatcher(
+        db,
+        collection or os.environ['DISPATCHER_COLLECTION'],
+        max_workers=int(os.environ.get('DISPATCHER_WORKERS', 8)),
+        lease_seconds=float(os.environ.get('DISPATCHER_LEASE_SECONDS', 540)),
+        max_retries=int(os.environ.get('DISPATCHER_MAX_RETRIES', 3)),
+        page_size=int(os.environ.get('DISPATCHER_PAGE_SIZE', 50))
+    )
+    return dispatcher.dispatch(limit)
@@ -2,3 +2,11 @@ class ApiError(Exception):
     def __init__(self, status_code, message="Something went wrong, status code: {}") -> None:
         self.message = message.format(status_code)
         super().__init__(self.message)
+
+
+class DnisSwapError(Exception):
+    def __init__(self, errors, journal, message="DNIS swap failed for campaigns: {}") -> None:
+        self.errors = errors
+        self.journal = journal
+        self.message = message.format(", ".join(errors))
+        super().__init__(self.message)
@@ -1,11 +1,17 @@
 from .apps import *
 from .utils import *
+from .cache import client_pool, TTLCache, FirestoreBackend
+from .transport import http_transport, HostRateLimiter
+from .spam import SPAM_PROVIDERS
+from .async_apps import ASYNC_APPS, AsyncGHL
+from concurrent.futures import ThreadPoolExecutor
 import os
-from google.cloud import firestore
-from bs4 import BeautifulSoup
-import requests
-from datetime import datetime
+from datetime import datetime, timezone
+import asyncio
+import atexit
 import base64
+import threading
+import time
 
 
 JOB_STATES = ["queued", "completed", "skipped", "error"]
@@ -22,6 +28,19 @@ class AbstractService:
     def execute_service(self):
         pass
 
+    async def execute_service_async(self):
+        """
+        Runs the service from a coroutine, services with async clients override
+        it, the others run execute_service in the default executor of the loop.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.execute_service)
+
+    def get_app_instance(self, *args):
+        return client_pool.get(self.app, *args)
+
+    def get_async_app_instance(self, *args):
+        return client_pool.get(ASYNC_APPS[self.app], *args)
+
 
 class MissionRealty(AbstractService):
 
@@ -32,7 +51,7 @@ class MissionRealty(AbstractService):
         super().__init__(config, job, app)
 
     def execute_service(self) -> dict:
-        app_instance = self.app(self.config['params']['apiKey'], 'AT')
+        app_instance = self.get_app_instance(self.config['params']['apiKey'], 'AT')
         notes = self.job['request']['notes'] if self.job['request']['notes'] else self.job['request']['disposition']
         lead = app_instance.find_leads(
             lead_phone=f"+1{self.job['request']['phone']}", lead_email=self.job['request']['email'])
@@ -48,6 +67,23 @@ class MissionRealty(AbstractService):
         self.job['state_msg'] = notes_response
         return self.job
 
+    async def execute_service_async(self) -> dict:
+        app_instance = self.get_async_app_instance(self.config['params']['apiKey'], 'AT')
+        notes = self.job['request']['notes'] if self.job['request']['notes'] else self.job['request']['disposition']
+        lead = await app_instance.find_leads(
+            lead_phone=f"+1{self.job['request']['phone']}", lead_email=self.job['request']['email'])
+        if not lead:
+            lead = await app_instance.add_new_lead(self.job['request'])
+        lead_id = lead['leadId'] if 'leadId' in lead else lead['id']
+        notes_response = await app_instance.add_note(
+            lead_id, notes)
+        if not notes_response['success']:
+            self.job['state'] = JOB_STATES[2]
+            self.job['state_msg'] = notes_response
+        self.job['state'] = JOB_STATES[1]
+        self.job['state_msg'] = notes_response
+        return self.job
+
 
 class OwnLaHomes(AbstractService):
 
@@ -58,7 +94,7 @@ class OwnLaHomes(AbstractService):
         super().__init__(config, job, app)
 
     def execute_service(self):
-        app_instance = self.app(self.config['params']['apiKey'], 'AT')
+        app_instance = self.get_app_instance(self.config['params']['apiKey'], 'AT')
         notes = self.job['request']['notes'] if self.job['request']['notes'] else self.job['request']['disposition']
         lead = app_instance.find_leads(
             lead_phone=f"+1{self.job['request']['phone']}", lead_email=self.job['request']['email'])
@@ -76,6 +112,72 @@ class OwnLaHomes(AbstractService):
         self.job['state_msg'] = notes_response
         return self.job
 
+    async def execute_service_async(self):
+        app_instance = self.get_async_app_instance(self.config['params']['apiKey'], 'AT')
+        notes = self.job['request']['notes'] if self.job['request']['notes'] else self.job['request']['disposition']
+        lead = await app_instance.find_leads(
+            lead_phone=f"+1{self.job['request']['phone']}", lead_email=self.job['request']['email'])
+        if not lead:
+            self.job['state'] = JOB_STATES[2]
+            self.job['state_msg'] = "Lead not found, update skipped"
+            return self.job
+        lead_id = lead['leadId'] if 'leadId' in lead else lead['id']
+        notes_response = await app_instance.add_note(
+            lead_id, notes)
+        if not notes_response['success']:
+            self.job['state'] = JOB_STATES[2]
+            self.job['state_msg'] = notes_response
+        self.job['state'] = JOB_STATES[1]
+        self.job['state_msg'] = notes_response
+        return self.job
+
+
+class ContactMatcher:
+
+    """
+    Collects the numbers of the Five9 contact records that exactly match the
+    search values of a request. Field positions are resolved once and the
+    request values are normalized into a key compared against each record.
+    :param list fields: the fields returned by the contact search.
+    :param dict request: search field -> value to match.
+    :param str skipped_number: number that is never collected.
+    """
+
+    NUMBER_FIELDS = ["number1", "number2", "number3"]
+
+    def __init__(self, fields: list, request: dict, skipped_number: str) -> None:
+        self.search_positions = [fields.index(field) for field in request.keys()]
+        self.number_positions = [fields.index(field)
+                                 for field in self.NUMBER_FIELDS if field in fields]
+        self.key = tuple(ContactMatcher.normalize(value)
+                         for value in request.values())
+        self.skipped_number = skipped_number
+        self.collected = set()
+
+    def match(self, records: list) -> list:
+        """
+        Returns the numbers of the matching records not collected by a previous call.
+        """
+        numbers = []
+        normalize = ContactMatcher.normalize
+        for record in records:
+            data = record['values']['data']
+            if tuple(normalize(data[index]) for index in self.search_positions) == self.key:
+                self.collect(data, numbers)
+        return numbers
+
+    def collect(self, data: list, numbers: list) -> None:
+        for index in self.number_positions:
+            number = data[index]
+            if number is None or number == self.skipped_number or number in self.collected:
+                continue
+            self.collected.add(number)
+            numbers.append(number)
+
+    @classmethod
+    def normalize(cls, value) -> str:
+        return "" if value is None else str(value).strip().lower()
+
 
 class MultiLeadUpdate(AbstractService):
 
@@ -120,61 +222,59 @@ class MultiLeadUpdate(AbstractService):
             self.job['state'] = JOB_STATES[2]
             self.job['state_msg'] = "All search values are empty"
             return self.job
-        app_instance = self.app(
+        app_instance = self.get_app_instance(
             self.config['params']['user'],
             self.config['params']['password']
         )
-        contacts = app_instance.search_contacts(self.search_criteria)
-        if contacts is None:
+        matcher = None
+        total_records = 0
+        dnc_list = []
+        truncation = []
+        for fields, records in app_instance.iter_contacts(
+                self.search_criteria, self.config['params'].get('splitField', 'number1'),
+                truncation=truncation):
+            if matcher is None:
+                matcher = ContactMatcher(
+                    fields, self.data_to_match, self.number_to_skip)
+            total_records += len(records)
+            dnc_list += matcher.match(records)
+        if total_records == 0:
             self.job['state'] = JOB_STATES[2]
-            self.job['state_msg'] = "No records found."
+            self.job['state_msg'] = self.truncated_msg("No records found.", truncation)
             return self.job
-        if len(contacts['records']) == 1000 or len(contacts['records']) == 1:
+        if total_records == 1:
             self.job['state'] = JOB_STATES[2]
-            self.job['state_msg'] = f"Too many records found: ${len(contacts['records'])}" if len(
-                contacts['records']) == 1000 else f"No duplicate contacts found."
+            self.job['state_msg'] = self.truncated_msg(f"No duplicate contacts found.", truncation)
             return self.job
-        dnc_list = self.get_exact_match(
-            contacts['fields'], contacts['records'], self.data_to_match, self.number_to_skip)
         if len(dnc_list) == 0:
             self.job['state'] = JOB_STATES[2]
-            self.job['state_msg'] = "No match found in search result."
+            self.job['state_msg'] = self.truncated_msg("No match found in search result.", truncation)
             return self.job
-        self.add_to_dnc(dnc_list, app_instance)
+        dnc_reports = self.add_to_dnc(dnc_list, app_instance)
         self.send_notification(dnc_list)
         self.job['state'] = JOB_STATES[1]
         self.job['state_msg'] = {
             "numbersToDnc": dnc_list,
-            "skippedNumber": self.number_to_skip
+            "skippedNumber": self.number_to_skip,
+            "rejectedNumbers": [number for report in dnc_reports for number in report['rejected']],
+            "truncated": truncation
         }
         return self.job
 
+    def truncated_msg(self, message: str, truncation: list) -> str:
+        # the search may have missed records, the message should not read as a complete result
+        if not truncation:
+            return message
+        return f"{message} Search results may be incomplete: {' '.join(truncation)}"
+
     def get_exact_match(self, fields: list, values: list, request: dict, skipped_number: str) -> list:
-        dnc_list = []
-        indexes = [fields.index(field) for field in request.keys()]
-        for value in values:
-            extracted_values = [value['values']['data'][index] if value['values']
-                                ['data'][index] is not None else "" for index in indexes]
-            if extracted_values.sort() == list(request.values()).sort():
-                for i in range(3):
-                    number_field_index = fields.index(
-                        f"number{i+1}")
-                    if value['values']['data'][number_field_index] is None:
-                        continue
-                    if value['values']['data'][number_field_index] == skipped_number:
-                        continue
-                    dnc_list.append(value['values']['data']
-                                    [number_field_index])
-        return dnc_list
-
-    def add_to_dnc(self, numbers: list, app_instance) -> int:
-        if len(numbers) == 6 or len(numbers) == 5:
-            list1 = numbers[:3]
-            list2 = numbers[3:]
-            response1 = app_instance.configuration.addNumbersToDnc(list1)
-            response2 = app_instance.configuration.addNumbersToDnc(list2)
-            return response1 + response2
-        return app_instance.configuration.addNumbersToDnc(numbers)
+        return ContactMatcher(fields, request, skipped_number).match(values)
+
+    def add_to_dnc(self, numbers: list, app_instance) -> list:
+        reports = get_dnc_writer(app_instance).add(numbers)
+        if reports and not any(report['accepted'] for report in reports):
+            raise ApiError(500, "Numbers could not be added to the DNC list, status code: {}")
+        return reports
 
     def send_notification(self, dnc_list):
         for_markdown = {
@@ -200,6 +300,85 @@ class MultiLeadUpdate(AbstractService):
 ROT_TYPES = ["spam_detection", "auto_rotation", "on_demand"]
 REQ_TYPES = ["auto_request", "spam_request"]
 
+# Fields of the ANI rotation configs read by the scheduled runs.
+CONFIG_FIELDS = [
+    'configuration.aniPool',
+    'configuration.profiles',
+    'configuration.updated',
+    'configuration.notifications',
+    'configuration.requestSchedule',
+    'configuration.newAniRequestData'
+]
+
+# Shared by every job of the instance so concurrent runs respect the same limit.
+spam_rate_limiter = HostRateLimiter(float(os.environ.get('SPAM_LOOKUP_RATE', 5)))
+
+
+class SpamVerdictCache:
+
+    """
+    Spam lookup results keyed by the normalized ANI (last 10 digits).
+    Spam and clean verdicts expire separately, entries live in process memory
+    and, when a backend is given, in the backend so every instance shares them.
+    :param backend: optional persistent store, e.g. FirestoreBackend.
+    A cached clean verdict hides a number that gets flagged until it expires,
+    so clean_ttl should not exceed the interval of the rotation schedules. A
+    cached spam verdict only keeps a number that was cleared out of rotation
+    a bit longer, so it can be kept longer.
+    :param float spam_ttl: seconds a spam verdict is valid.
+    :param float clean_ttl: seconds a clean verdict is valid.
+    """
+
+    def __init__(self, backend=None, spam_ttl: float = 86400, clean_ttl: float = 3600) -> None:
+        self.backend = backend
+        self.spam_ttl = spam_ttl
+        self.clean_ttl = clean_ttl
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, ani: str):
+        """
+        :return the cached verdict (bool) or None when it is missing or expired.
+        """
+        key = SpamVerdictCache.normalize(ani)
+        entry = self.entries.get(key)
+        if entry is None and self.backend is not None:
+            entry = self.backend.get(f"spam_{key}")
+            if entry is not None:
+                self.entries[key] = entry
+        valid = entry is not None and time.time() - entry[0] < (
+            self.spam_ttl if entry[1] else self.clean_ttl)
+        with self.lock:
+            if valid:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry[1] if valid else None
+
+    def set(self, ani: str, is_spam: bool) -> None:
+        key = SpamVerdictCache.normalize(ani)
+        entry = (time.time(), is_spam)
+        self.entries[key] = entry
+        if self.backend is not None:
+            self.backend.set(f"spam_{key}", is_spam, entry[0])
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+    @classmethod
+    def normalize(cls, ani: str) -> str:
+        return "".join(char for char in str(ani) if char.isdigit())[-10:]
+
+
+spam_verdicts = SpamVerdictCache(
+    backend=FirestoreBackend(os.environ['SPAM_VERDICT_COLLECTION'])
+    if os.environ.get('SPAM_VERDICT_COLLECTION') else None,
+    spam_ttl=float(os.environ.get('SPAM_VERDICT_TTL', 86400)),
+    clean_ttl=float(os.environ.get('CLEAN_VERDICT_TTL', 3600))
+)
+
 
 class AniRotationEngine(AbstractService):
     """
@@ -218,7 +397,19 @@ class AniRotationEngine(AbstractService):
             'project': 'str',
             'collection': 'str',
             'user': 'str',
-            'password': 'str'
+            'password': 'str',
+            # optional
+            'spamProvider': 'str',
+            'spamWorkers': int,
+            'spamTimeout': float,
+            'dnisWorkers': int,
+            'pageSize': int,
+            'checkpointCollection': 'str',
+            'checkpointTtl': float,
+            'jobsCollection': 'str',
+            'shardCollection': 'str',
+            'shardSize': int,
+            'maxShards': int
         },
         'created': DatetimeWithNanoseconds,
         'webHookDev': 'str',
@@ -232,7 +423,14 @@ class AniRotationEngine(AbstractService):
         "request": {
             'field': str,
             'type': str,
-            'schedule': str
+            'schedule': str,
+            # optional, 'auto' splits the run into shards queued as new jobs
+            'shards': str,
+            # set on the jobs of a shard
+            'shard': int,
+            'runId': str,
+            'startAfter': str,
+            'endAt': str
         },
         "state_msg": str or dict (depends on state),
         "service_instance": dict,
@@ -246,68 +444,199 @@ class AniRotationEngine(AbstractService):
         self.config = config
         self.job = job
         self.app = app
-        self.robo_url = 'https://www.nomorobo.com/lookup/{}'
-        self.headers = {
-            'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-            'accept-encoding': 'gzip, deflate, br',
-            'accept-language': 'en-US,en;q=0.8',
-            'upgrade-insecure-requests': '1',
-            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/61.0.3163.100 Safari/537.36'
-        }
+        self.spam_provider = SPAM_PROVIDERS[self.config['params'].get(
+            'spamProvider', 'nomorobo')]()
+        self.spam_workers = int(self.config['params'].get('spamWorkers', 8))
+        self.spam_timeout = float(self.config['params'].get('spamTimeout', 10))
+        self.dnis_workers = int(self.config['params'].get('dnisWorkers', 4))
+        self.page_size = int(self.config['params'].get('pageSize', 200))
+        self.checkpoint_collection = self.config['params'].get(
+            'checkpointCollection', f"{self.config['params']['collection']}Checkpoints")
+        self.checkpoint_ttl = float(
+            self.config['params'].get('checkpointTtl', 3600))
+        # sharding, jobs of the shards are queued in jobsCollection
+        self.jobs_collection = self.config['params'].get('jobsCollection')
+        self.shard_collection = self.config['params'].get(
+            'shardCollection', f"{self.config['params']['collection']}Shards")
+        self.shard_size = int(self.config['params'].get('shardSize', 100))
+        self.max_shards = int(self.config['params'].get('maxShards', 50))
+        # Five9 lookups shared by every rotation of the run
+        self.inbound_campaigns = None
+        self.campaign_profiles = {}
 
         super().__init__(config, job, app)
 
     def execute_service(self):
+        from google.cloud import firestore
         db = firestore.Client(self.config['params']['project'])
         ani_rot_collection = self.config['params']['collection']
-        field = self.job['request']['field']
         req_type = self.job['request']['type']
-        if req_type != ROT_TYPES[2]:
-            query = query_doc(db, ani_rot_collection, field,
-                              "==", self.job['request']['schedule'])
-        else:
-            query = get_doc(db, ani_rot_collection,
-                            self.job['request']['id'])
-        if len(query) == 0:
+        # config changes of the run are committed together, see BatchWriter
+        self.writer = BatchWriter(db)
+        try:
+            if req_type == ROT_TYPES[2]:
+                config = get_doc(db, ani_rot_collection,
+                                 self.job['request']['id'])
+                if not config:
+                    self.job['state'] = JOB_STATES[2]
+                    self.job['state_msg'] = "No items configured for service."
+                    return self.job
+                self._execute_on_demand_service(config)
+                self.job['state'] = JOB_STATES[1]
+                self.job['state_msg'] = {
+                    "success": True
+                }
+                return self.job
+            if req_type == ROT_TYPES[0]:
+                service = self._execute_spam_service
+            elif req_type == ROT_TYPES[1]:
+                service = self._execute_auto_rotation_service
+            elif req_type in REQ_TYPES:
+                def service(query, db, collection):
+                    return self._execute_new_request_service(query, db, collection, req_type)
+            else:
+                return self.job
+            if self.job['request'].get('shards') == 'auto' and 'shard' not in self.job['request'] \
+                    and self.jobs_collection:
+                shards = self._fan_out(db, ani_rot_collection)
+                if shards is not None:
+                    return self.job
+            cache_stats = spam_verdicts.stats()
+            try:
+                processed, affected_profiles = self._execute_paged(
+                    service, db, ani_rot_collection)
+            except Exception:
+                self._set_shard_state(JOB_STATES[3])
+                raise
+            self._set_shard_state(JOB_STATES[1])
+        finally:
+            self.writer.commit()
+        if processed == 0:
             self.job['state'] = JOB_STATES[2]
             self.job['state_msg'] = "No items configured for service."
             return self.job
+        self.job['state'] = JOB_STATES[1]
+        self.job['state_msg'] = {
+            "success": True
+        }
+        if req_type in ROT_TYPES[:2]:
+            self.job['state_msg']['affected_profiles'] = affected_profiles
         if req_type == ROT_TYPES[0]:
-            affected_profiles = self._execute_spam_service(
-                query, db, ani_rot_collection)
-            self.job['state'] = JOB_STATES[1]
-            self.job['state_msg'] = {
-                "success": True,
-                "affected_profiles": affected_profiles
-            }
-            return self.job
-        elif req_type == ROT_TYPES[1]:
-            affected_profiles = self._execute_auto_rotation_service(
-                query, db, ani_rot_collection)
+            self.job['state_msg']['spam_cache'] = {
+                key: value - cache_stats[key] for key, value in spam_verdicts.stats().items()}
+        return self.job
 
-            self.job['state'] = JOB_STATES[1]
-            self.job['state_msg'] = {
-                "success": True,
-                "affected_profiles": affected_profiles
-            }
-            return self.job
-        elif req_type == ROT_TYPES[2]:
-            self._execute_on_demand_service(query)
-            self.job['state'] = JOB_STATES[1]
-            self.job['state_msg'] = {
-                "success": True
-            }
-        elif req_type in REQ_TYPES:
-            self._execute_new_request_service(
-                query, db, ani_rot_collection, req_type)
-            self.job['state'] = JOB_STATES[1]
-            self.job['state_msg'] = {
-                "success": True
+    def _execute_paged(self, service, db, collection) -> tuple:
+        """
+        Runs service over the configs of the schedule one page at a time, the
+        id of the last config of each page is saved as a checkpoint with the
+        page writes so a run stopped by a timeout resumes after it. The
+        checkpoint belongs to the job (its shard or created time), so a new run
+        of the same schedule starts from the beginning.
+        :return the number of configs processed and the affected profiles.
+        """
+        request = self.job['request']
+        resume = True
+        if 'shard' in request:
+            checkpoint_id = f"{request['runId']}_{request['shard']}"
+        else:
+            checkpoint_id = "{}_{}_{}".format(
+                request['type'], request['field'], request['schedule']).replace("/", "_")
+            if self.job.get('created'):
+                checkpoint_id += f"_{self.job['created'].strftime('%Y%m%d%H%M%S%f')}"
+            else:
+                # without created only a retry of the job can be told apart
+                resume = self.job.get('retry_attempt', 0) > 0
+        start_after = (self._load_checkpoint(db, checkpoint_id) if resume else None) \
+            or request.get('startAfter')
+        processed = 0
+        affected_profiles = []
+        for page in stream_pages(
+                db, collection, request['field'], "==", request['schedule'],
+                CONFIG_FIELDS, self.page_size, start_after, request.get('endAt')):
+            processed += len(page)
+            affected_profiles += service(page, db, collection) or []
+            self.writer.set(self.checkpoint_collection, checkpoint_id, {
+                'lastId': page[-1].id,
+                'updated': datetime.now(timezone.utc)
+            })
+            self.writer.commit()
+        self.writer.delete(self.checkpoint_collection, checkpoint_id)
+        return processed, affected_profiles
+
+    def _fan_out(self, db, collection):
+        """
+        Splits the configs of the schedule into contiguous id ranges of about
+        shard_size configs and queues one job per range, the state of each
+        shard is tracked in a document of shard_collection named after the run.
+        :return the number of shards or None when one shard is enough and the
+        run should continue in this invocation.
+        """
+        request = self.job['request']
+        ids = [snapshot.id for page in stream_pages(
+            db, collection, request['field'], "==", request['schedule'], ['__name__'], 1000)
+            for snapshot in page]
+        shard_count = min(max(-(-len(ids) // self.shard_size), 1), self.max_shards)
+        if shard_count == 1:
+            return None
+        run_id = "{}_{}_{}_{}".format(
+            request['type'], request['field'], request['schedule'],
+            datetime.now().strftime("%Y%m%d%H%M%S")).replace("/", "_")
+        size = -(-len(ids) // shard_count)
+        shards = {}
+        for shard in range(shard_count):
+            shard_ids = ids[shard * size:(shard + 1) * size]
+            if not shard_ids:
+                continue
+            shard_request = dict(
+                request, shard=shard, runId=run_id, endAt=shard_ids[-1],
+                startAfter=ids[shard * size - 1] if shard else None)
+            shards[f"shard_{shard}"] = {
+                'state': JOB_STATES[0],
+                'jobId': f"{run_id}_{shard}",
+                'configs': len(shard_ids)
             }
-        return self.job
+            self.writer.set(self.jobs_collection, f"{run_id}_{shard}", {
+                'request': shard_request,
+                'service_instance': self.job.get('service_instance', self.config),
+                'state': JOB_STATES[0],
+                'state_msg': "",
+                'retry_attempt': 0,
+                'created': datetime.now()
+            })
+        self.writer.set(self.shard_collection, run_id, {
+            'request': request,
+            'shards': shards,
+            'created': datetime.now()
+        })
+        self.writer.commit()
+        self.job['state'] = JOB_STATES[1]
+        self.job['state_msg'] = {
+            "success": True,
+            "runId": run_id,
+            "shards": len(shards)
+        }
+        return len(shards)
+
+    def _set_shard_state(self, state):
+        request = self.job['request']
+        if 'shard' not in request:
+            return
+        self.writer.update(self.shard_collection, request['runId'], {
+            f"shards.shard_{request['shard']}.state": state,
+            f"shards.shard_{request['shard']}.updated": datetime.now()
+        })
+
+    def _load_checkpoint(self, db, checkpoint_id):
+        checkpoint = get_doc(db, self.checkpoint_collection, checkpoint_id)
+        if not checkpoint:
+            return None
+        if (datetime.now(timezone.utc) - checkpoint['updated']).total_seconds() > self.checkpoint_ttl:
+            return None
+        return checkpoint['lastId']
 
     def _execute_on_demand_service(self, config):
-        app_instance = self.app(
+        app_instance = self.get_app_instance(
             self.config['params']['user'],
             self.config['params']['password']
         )
@@ -325,10 +654,13 @@ class AniRotationEngine(AbstractService):
         for config in query:
             config_dict = config.to_dict()
             self.send_new_request(config_dict, req_type)
-            update_doc(db, collection, config.id, config_dict)
+            if 'newAniRequestData' in config_dict['configuration']:
+                self.writer.update(collection, config.id, {
+                    'configuration.newAniRequestData': config_dict['configuration']['newAniRequestData']
+                })
 
     def _execute_auto_rotation_service(self, query, db, collection):
-        app_instance = self.app(
+        app_instance = self.get_app_instance(
             self.config['params']['user'],
             self.config['params']['password']
         )
@@ -340,7 +672,6 @@ class AniRotationEngine(AbstractService):
             if (all([ani['isSpam'] for ani in config_dict['configuration']['aniPool']])):
                 continue
             if config_dict['configuration']['aniPool'][1]['isSpam']:
-                update_doc(db, collection, config.id, config_dict)
                 continue
             if "updated" in config_dict["configuration"] and config_dict["configuration"]["updated"].date() == datetime.today().date():
                 continue
@@ -350,7 +681,7 @@ class AniRotationEngine(AbstractService):
                 app_instance)
             config_dict['configuration']['aniPool'] = new_ani_pool
             config_dict["configuration"]["updated"] = datetime.today()
-            update_doc(db, collection, config.id, config_dict)
+            self._update_ani_pool(collection, config.id, config_dict)
             self.notify_change(
                 new_ani_pool[0]['ani'],
                 new_ani_pool[-1]['ani'],
@@ -363,11 +694,12 @@ class AniRotationEngine(AbstractService):
         return affected_profiles
 
     def _execute_spam_service(self, query, db, collection):
-        app_instance = self.app(
+        app_instance = self.get_app_instance(
             self.config['params']['user'],
             self.config['params']['password']
         )
         affected_profiles = []
+        configs = []
         for config in query:
             config_dict = config.to_dict()
             if len(config_dict['configuration']['aniPool']) == 1:
@@ -375,13 +707,16 @@ class AniRotationEngine(AbstractService):
             if (all([ani['isSpam'] for ani in config_dict['configuration']['aniPool']])):
                 self.send_new_request(config_dict, REQ_TYPES[1])
                 continue
-            is_spam = self._spam_detection(
-                config_dict['configuration']['aniPool'][0]['ani'])
+            configs.append((config, config_dict))
+        spam_results = self._check_spam(
+            [config_dict['configuration']['aniPool'][0]['ani'] for _, config_dict in configs])
+        for config, config_dict in configs:
+            is_spam = spam_results[config_dict['configuration']['aniPool'][0]['ani']]
             if not is_spam:
                 continue
             config_dict['configuration']['aniPool'][0]['isSpam'] = True
             if config_dict['configuration']['aniPool'][1]['isSpam']:
-                update_doc(db, collection, config.id, config_dict)
+                self._update_ani_pool(collection, config.id, config_dict)
                 continue
             if "updated" in config_dict["configuration"] and config_dict["configuration"]["updated"].date() == datetime.today().date():
                 continue
@@ -391,7 +726,7 @@ class AniRotationEngine(AbstractService):
                 app_instance)
             config_dict['configuration']['aniPool'] = new_ani_pool
             config_dict["configuration"]["updated"] = datetime.today()
-            update_doc(db, collection, config.id, config_dict)
+            self._update_ani_pool(collection, config.id, config_dict)
             self.notify_change(
                 new_ani_pool[0]['ani'],
                 new_ani_pool[-1]['ani'],
@@ -403,22 +738,44 @@ class AniRotationEngine(AbstractService):
                 config_dict['configuration']['profiles'][0])
         return affected_profiles
 
+    def _update_ani_pool(self, collection, id, config_dict):
+        fields = {'configuration.aniPool': config_dict['configuration']['aniPool']}
+        if 'updated' in config_dict['configuration']:
+            fields['configuration.updated'] = config_dict['configuration']['updated']
+        self.writer.update(collection, id, fields)
+
+    def _check_spam(self, anis: list) -> dict:
+        """
+        Checks the ANIs concurrently with up to spam_workers lookups in flight.
+        :return dict of ani -> is spam, None when the lookup failed.
+        """
+        anis = list(dict.fromkeys(anis))
+        if not anis:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.spam_workers, len(anis))) as executor:
+            return dict(zip(anis, executor.map(self._cached_spam_detection, anis)))
+
+    def _cached_spam_detection(self, ani):
+        is_spam = spam_verdicts.get(ani)
+        if is_spam is not None:
+            return is_spam
+        # a failed lookup should not stop the checks of the other profiles
+        try:
+            is_spam = self._spam_detection(ani)
+        except Exception as error:
+            print(f"Spam detection failed for {ani}: {error}")
+            return None
+        spam_verdicts.set(ani, is_spam)
+        return is_spam
+
     def _spam_detection(self, ani):
-        ani_with_dashes = "{}-{}-{}".format(ani[:3], ani[3:6], ani[6::])
-        with requests.Session() as s:
-            response = s.get(url=self.robo_url.format(
-                ani_with_dashes), headers=self.headers)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        for script in soup(["script", "style", "br", "footer", "ul", "nav"]):
-            script.extract()
-        text = (soup.get_text().replace('\n', '').strip())
-        answer = "404" not in text
-        return answer
+        return self.spam_provider.lookup(
+            ani, http_transport, timeout=self.spam_timeout, rate_limiter=spam_rate_limiter)
 
     def rotate_ani(self, ani_pool: list, profile_name, client, on_demand=False):
-        profile = client.get_campaign_profile(profile_name)
-        inbound_campaigns = [
-            c['name'] for c in client.get_inbound_campaigns() if c['profileName'] == profile['name']]
+        profile = self._get_campaign_profile(profile_name, client)
+        inbound_campaigns = self._get_profile_inbound_campaigns(
+            profile['name'], client)
         profile_config = {
             "ANI": ani_pool[1]['ani'] if not on_demand else ani_pool[0]['ani'],
             "description": profile['description'],
@@ -429,12 +786,20 @@ class AniRotationEngine(AbstractService):
             "name": profile['name'],
             "numberOfAttempts": profile['numberOfAttempts'],
         }
-        client.update_campaign_profile(profile_config)
-        for campaign in inbound_campaigns:
-            client.remove_dnis_list(
-                campaign, [ani_pool[0]['ani']] if not on_demand else [ani_pool[-1]['ani']])
-            client.update_dnis_list(
-                campaign, [ani_pool[1]['ani']] if not on_demand else [ani_pool[0]['ani']])
+        # DNIS swaps run first so a failure leaves the profile untouched,
+        # a failed profile update undoes the swaps.
+        dnis_executor = DnisSwapExecutor(client, self.dnis_workers)
+        journal = dnis_executor.swap(
+            inbound_campaigns,
+            ani_pool[0]['ani'] if not on_demand else ani_pool[-1]['ani'],
+            ani_pool[1]['ani'] if not on_demand else ani_pool[0]['ani'])
+        try:
+            client.update_campaign_profile(profile_config)
+        except Exception:
+            dnis_executor.rollback(journal)
+            raise
+        self.campaign_profiles[profile_name] = dict(
+            profile, ANI=profile_config['ANI'])
         if not on_demand:
             deactivated_ani = ani_pool.pop(0)
             deactivated_ani['active'] = False
@@ -442,6 +807,21 @@ class AniRotationEngine(AbstractService):
             ani_pool[0]['active'] = True
         return ani_pool
 
+    def _get_campaign_profile(self, profile_name, client):
+        if profile_name not in self.campaign_profiles:
+            self.campaign_profiles[profile_name] = client.get_campaign_profile(
+                profile_name)
+        return self.campaign_profiles[profile_name]
+
+    def _get_profile_inbound_campaigns(self, profile_name, client) -> list:
+        # all inbound campaigns are fetched once per run and grouped by profile
+        if self.inbound_campaigns is None:
+            self.inbound_campaigns = {}
+            for campaign in client.get_inbound_campaigns() or []:
+                self.inbound_campaigns.setdefault(
+                    campaign['profileName'], []).append(campaign['name'])
+        return self.inbound_campaigns.get(profile_name, [])
+
     def send_new_request(self, config, reason):
         today = datetime.now().isoformat().split("T")[0]
         area_codes = config['configuration']['requestSchedule']['areaCodes']
@@ -530,6 +910,186 @@ class AniRotationEngine(AbstractService):
         return send_email(sender, password, recipients_list, subject, body)
 
 
+# (engine url, table) -> {column name: column type}
+table_schemas = TTLCache(
+    maxsize=64, ttl=float(os.environ.get('SQL_SCHEMA_TTL', 3600)))
+# (table, columns) -> INSERT statement
+insert_statements = TTLCache(maxsize=256, ttl=float('inf'))
+
+# MySQL error code of "Unknown column"
+ER_BAD_FIELD_ERROR = 1054
+
+
+def get_table_schema(db_engine: SQLDB, table: str, refresh: bool = False) -> dict:
+    """
+    Returns the columns of the table as a dict of name -> type, cached per
+    database and table for SQL_SCHEMA_TTL seconds.
+    """
+    key = (repr(db_engine.engine.url), table)
+    schema = None if refresh else table_schemas.get(key)
+    if schema is None:
+        query = db_engine.execute_sql(f'SHOW columns FROM {table}')
+        schema = {column[0]: column[1] for column in query}
+        table_schemas.set(key, schema)
+    return schema
+
+
+def get_insert_statement(table: str, columns: list) -> str:
+    key = (table, tuple(columns))
+    query_string = insert_statements.get(key)
+    if query_string is None:
+        query_string = f"""INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(['%s' for col in columns])})"""
+        insert_statements.set(key, query_string)
+    return query_string
+
+
+class InsertBuffer:
+
+    """
+    Buffers rows in process grouped by database, table and columns, a group is
+    inserted with a single executemany when it reaches max_rows rows or when its
+    oldest row is max_age seconds old. add returns a future the job waits on,
+    so a job only completes once its row is stored and rows of concurrent jobs
+    share the inserts.
+
+    When a group insert fails on an unknown column the table schema is loaded
+    again and the rows are regrouped on the columns that still exist, on other
+    errors the rows are inserted one at a time. Rows that still fail are put
+    back in the buffer and retried on the next flush, after max_attempts their
+    future gets the error so the job fails and can be retried.
+    """
+
+    def __init__(self, max_rows: int = 100, max_age: float = 5, max_attempts: int = 3) -> None:
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.max_attempts = max_attempts
+        self.groups = {}
+        self.flush_timer = None
+        self.lock = threading.Lock()
+        atexit.register(self.flush_all)
+
+    def add(self, db_engine: SQLDB, table: str, columns: list, values: list) -> Future:
+        """
+        :return a future set to True once the row is inserted, or to the
+        error of the last attempt.
+        """
+        future = Future()
+        group = self.buffer(db_engine, table, [(dict(zip(columns, values)), 0, future)])
+        if group is not None:
+            self.flush_group(group)
+        return future
+
+    def buffer(self, db_engine: SQLDB, table: str, rows: list) -> dict:
+        """
+        Adds (row, attempts, future) tuples to their groups.
+        :return the group removed from the buffer when it reached max_rows.
+        """
+        full = None
+        with self.lock:
+            for row in rows:
+                key = (repr(db_engine.engine.url), table, tuple(row[0]))
+                group = self.groups.setdefault(key, {
+                    'db_engine': db_engine,
+                    'table': table,
+                    'rows': [],
+                    'created': time.monotonic()
+                })
+                group['rows'].append(row)
+                if len(group['rows']) >= self.max_rows and full is None:
+                    full = self.groups.pop(key)
+            if self.groups and self.flush_timer is None:
+                self.flush_timer = threading.Timer(self.max_age, self.flush_due)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+        return full
+
+    def flush_due(self) -> None:
+        with self.lock:
+            self.flush_timer = None
+            now = time.monotonic()
+            due = [key for key, group in self.groups.items()
+                   if now - group['created'] >= self.max_age]
+            groups = [self.groups.pop(key) for key in due]
+            if self.groups:
+                self.flush_timer = threading.Timer(self.max_age, self.flush_due)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+        for group in groups:
+            self.flush_group(group)
+
+    def flush_all(self) -> None:
+        with self.lock:
+            groups = list(self.groups.values())
+            self.groups = {}
+        for group in groups:
+            self.flush_group(group)
+
+    def flush_group(self, group: dict) -> None:
+        """
+        Inserts the rows of a group, the rows that could not be inserted are
+        buffered again or their futures get the error.
+        """
+        db_engine, table = group['db_engine'], group['table']
+        try:
+            self.insert(db_engine, table, group['rows'])
+            return
+        except Exception as error:
+            if not Five9ToMySQL.is_unknown_column(error):
+                print(f"Bulk insert of {len(group['rows'])} rows into {table} failed, inserting them one at a time: {error}")
+                self.insert_rows(db_engine, table, group['rows'])
+                return
+        # the cached schema is outdated when a column was dropped or renamed
+        try:
+            schema = get_table_schema(db_engine, table, refresh=True)
+        except Exception as error:
+            print(f"Schema of {table} could not be loaded: {error}")
+            self.retry(db_engine, table, group['rows'], error)
+            return
+        regrouped = {}
+        for row, attempts, future in group['rows']:
+            row = {column: value for column, value in row.items() if column in schema}
+            regrouped.setdefault(tuple(row), []).append((row, attempts, future))
+        for rows in regrouped.values():
+            try:
+                self.insert(db_engine, table, rows)
+            except Exception:
+                self.insert_rows(db_engine, table, rows)
+
+    def insert(self, db_engine: SQLDB, table: str, rows: list) -> None:
+        columns = list(rows[0][0])
+        db_engine.execute_sql(
+            get_insert_statement(table, columns),
+            [tuple(row[column] for column in columns) for row, attempts, future in rows])
+        for row, attempts, future in rows:
+            future.set_result(True)
+
+    def insert_rows(self, db_engine: SQLDB, table: str, rows: list) -> None:
+        for row in rows:
+            try:
+                self.insert(db_engine, table, [row])
+            except Exception as error:
+                print(f"Insert into {table} failed: {error}")
+                self.retry(db_engine, table, [row], error)
+
+    def retry(self, db_engine: SQLDB, table: str, rows: list, error: Exception) -> None:
+        retried = []
+        for row, attempts, future in rows:
+            if attempts + 1 < self.max_attempts:
+                retried.append((row, attempts + 1, future))
+                continue
+            future.set_exception(error)
+        if retried:
+            group = self.buffer(db_engine, table, retried)
+            if group is not None:
+                self.flush_group(group)
+
+
+insert_buffer = InsertBuffer(
+    max_rows=int(os.environ.get('SQL_BULK_MAX_ROWS', 100)),
+    max_age=float(os.environ.get('SQL_BULK_MAX_AGE', 5))
+)
+
+
 class Five9ToMySQL(AbstractService):
 
     def __init__(self, config: dict, job: dict, app: SQLDB) -> None:
@@ -541,10 +1101,26 @@ class Five9ToMySQL(AbstractService):
         super().__init__(config, job, app)
 
     def execute_service(self):
-        app_instance = self.app(self.config['params']['db_credentials'])
+        app_instance = self.get_app_instance(self.config['params']['db_credentials'])
         table_columns = self.get_db_columns(app_instance)
         values = self.get_db_values(table_columns)
-        self.insert(app_instance, table_columns, values)
+        if self.config['params'].get('bulkInsert'):
+            # waits for the insert of the row's group, a failed row raises so the job is retried
+            insert_buffer.add(app_instance, self.table, table_columns, values).result()
+            self.job['state'] = JOB_STATES[1]
+            self.job['state_msg'] = {
+                "message": "success"
+            }
+            return self.job
+        try:
+            self.insert(app_instance, table_columns, values)
+        except Exception as error:
+            # the cached schema is outdated when a column was dropped or renamed
+            if not Five9ToMySQL.is_unknown_column(error):
+                raise
+            table_columns = self.get_db_columns(app_instance, refresh=True)
+            values = self.get_db_values(table_columns)
+            self.insert(app_instance, table_columns, values)
         self.job['state'] = JOB_STATES[1]
         self.job['state_msg'] = {
             "message": "success"
@@ -552,10 +1128,13 @@ class Five9ToMySQL(AbstractService):
         return self.job
 
     def insert(self, db_engine: SQLDB, columns: list, values: list):
-        query_string = f"""INSERT INTO {self.table} ({", ".join(columns)}) VALUES ({", ".join(['%s' for col in columns])})"""
-        result = db_engine.execute_sql(query_string, values)
+        result = db_engine.execute_sql(
+            self.get_insert_statement(columns), values)
         return result
 
+    def get_insert_statement(self, columns: list) -> str:
+        return get_insert_statement(self.table, columns)
+
     def set_dynamic_fields(self):
         live_answer = {'live_answer': 'Yes' if self.data['disposition_name']
                        in self.config['params']['live_answer'] else "No"}
@@ -569,10 +1148,18 @@ class Five9ToMySQL(AbstractService):
         self.data[list(created_date_time.keys())[0]] = list(
             created_date_time.values())[0]
 
-    def get_db_columns(self, db_engine):
+    def get_db_columns(self, db_engine, refresh=False):
         self.set_dynamic_fields()
-        query = db_engine.execute_sql(f'SHOW columns FROM {self.table}')
-        return [column[0] for column in query if column[0] != 'id' and column[0].lower() in self.data]
+        schema = self.get_table_schema(db_engine, refresh)
+        return [column for column in schema if column != 'id' and column.lower() in self.data]
+
+    def get_table_schema(self, db_engine, refresh=False) -> dict:
+        return get_table_schema(db_engine, self.table, refresh)
+
+    @classmethod
+    def is_unknown_column(cls, error) -> bool:
+        orig = getattr(error, 'orig', None)
+        return bool(orig is not None and orig.args and orig.args[0] == ER_BAD_FIELD_ERROR)
 
     def get_db_values(self, columns):
         return [self.data[col.lower()] for col in columns if col.lower() in self.data]
@@ -610,7 +1197,7 @@ class LeviKvCore(AbstractService):
         super().__init__(config, job, app)
 
     def execute_service(self):
-        app_instance = self.app(self.config['params']['apiToken'])
+        app_instance = self.get_app_instance(self.config['params']['apiToken'])
         contact = app_instance.get_contact(self.job['request']['email'])
         if contact is None:
             self.job['state'] = JOB_STATES[2]
@@ -624,6 +1211,66 @@ class LeviKvCore(AbstractService):
         self.job['state_msg'] = notes_response
         return self.job
 
+    async def execute_service_async(self):
+        app_instance = self.get_async_app_instance(self.config['params']['apiToken'])
+        contact = await app_instance.get_contact(self.job['request']['email'])
+        if contact is None:
+            self.job['state'] = JOB_STATES[2]
+            self.job['state_msg'] = f"Contact not found with email: {self.job['request']['email']}"
+            return self.job
+        notes = self.job['request']['comments'] if self.job['request']['comments'] != "" else self.job['request']['disposition_name']
+        notes_response = await app_instance.update_notes(
+            contact['id'], self.notes_title, notes
+        )
+        self.job['state'] = JOB_STATES[1]
+        self.job['state_msg'] = notes_response
+        return self.job
+
+
+class CampaignLocationIndex:
+
+    """
+    Five9 campaign name -> GHL location id (the campaign description).
+    All the campaigns of a Five9 account are loaded with two getCampaigns calls
+    and shared by every job of the instance until the TTL expires, a campaign
+    missing from the index triggers a reload at most every miss_refresh seconds.
+    """
+
+    def __init__(self, ttl: float = 900, miss_refresh: float = 60) -> None:
+        self.indexes = TTLCache(maxsize=16, ttl=ttl)
+        self.miss_refresh = miss_refresh
+        self.loaded_at = {}
+        self.lock = threading.Lock()
+
+    def get(self, client: Five9Custom, campaign_name: str) -> str:
+        index = self.indexes.get(client.username)
+        if index is None or (campaign_name not in index and self.can_reload(client.username)):
+            index = self.load(client, campaign_name)
+        return index.get(campaign_name)
+
+    def can_reload(self, username: str) -> bool:
+        return time.monotonic() - self.loaded_at.get(username, 0) > self.miss_refresh
+
+    def load(self, client: Five9Custom, campaign_name: str = None) -> dict:
+        with self.lock:
+            # another job may have loaded the index while this one waited
+            index = self.indexes.get(client.username)
+            if index is not None and (campaign_name in index or not self.can_reload(client.username)):
+                return index
+            index = {}
+            for campaign in (client.get_outbound_campaigns() or []) + (client.get_inbound_campaigns() or []):
+                index[campaign['name']] = (campaign['description'] or "").strip()
+            self.indexes.set(client.username, index)
+            self.loaded_at[client.username] = time.monotonic()
+        return index
+
+    def invalidate(self, username: str) -> None:
+        self.indexes.pop(username)
+
+
+campaign_locations = CampaignLocationIndex(
+    ttl=float(os.environ.get('FIVE9_CAMPAIGN_INDEX_TTL', 900)))
+
 
 class Five9ToGHL(AbstractService):
     def __init__(self, config: dict, job: dict, app: GHL) -> None:
@@ -645,35 +1292,77 @@ class Five9ToGHL(AbstractService):
             self.config['params']['user'],
             self.config['params']['password']
         )
-        if "Inbound" not in self.data['campaign_name']:
-            location_id = five9_client.get_outbound_campaigns(
-                self.data['campaign_name'])[0]['description'].strip()
-        if "Inbound" in self.data['campaign_name']:
-            location_id = five9_client.get_inbound_campaigns(
-                self.data['campaign_name'])[0]['description'].strip()
-        app_instance = self.app(self.config['params']['apiKey'], location_id)
+        location_id = campaign_locations.get(
+            five9_client, self.data['campaign_name'])
+        if location_id is None:
+            self.job['state'] = JOB_STATES[2]
+            self.job['state_msg'] = f"Campaign {self.data['campaign_name']} not found in Five9."
+            return self.job
+        app_instance = self.get_app_instance(self.config['params']['apiKey'], location_id)
         query = f"phone=+1{phone}&email={email}"
-        contact = app_instance.contact_lookup(query)
+        with TaskGraph() as graph:
+            # the custom fields don't depend on the contact
+            graph.add('contact', app_instance.contact_lookup, query)
+            graph.add('custom_fields', app_instance.get_custom_fields_index)
+            contact = graph.result('contact')
+            if contact is None:
+                self.job['state'] = JOB_STATES[2]
+                self.job['state_msg'] = f"Contact not found, skipping update."
+                return self.job
+            custom_fields = graph.result('custom_fields')
+        contact_response = app_instance.update_contact(
+            contact['id'], self.contact_data(phone, contact, custom_fields))
+        notes_response = {}
+        if self.data['notes']:
+            notes_response = app_instance.add_notes(
+                contact['id'], self.data['notes'],
+                self.config['params']['userId']
+            )
+        self.job['state'] = JOB_STATES[1]
+        self.job['state_msg'] = {
+            'contact_response': contact_response,
+            'notes_response': notes_response
+        }
+        return self.job
+
+    async def execute_service_async(self):
+        phone = self.data['dnis'] if self.data[
+            'type_name'] != "Inbound" else self.data['ani']
+        email = self.data['email']
+        if phone == "" and email == "":
+            self.job['state'] = JOB_STATES[2]
+            self.job['state_msg'] = f"Request missing phone or email."
+            return self.job
+        five9_client = self.set_five9_client(
+            self.config['params']['user'],
+            self.config['params']['password']
+        )
+        # Five9 is a blocking SOAP client, the index is usually cached
+        location_id = await asyncio.get_running_loop().run_in_executor(
+            None, campaign_locations.get, five9_client, self.data['campaign_name'])
+        if location_id is None:
+            self.job['state'] = JOB_STATES[2]
+            self.job['state_msg'] = f"Campaign {self.data['campaign_name']} not found in Five9."
+            return self.job
+        app_instance = self.get_async_app_instance(self.config['params']['apiKey'], location_id)
+        query = f"phone=+1{phone}&email={email}"
+        custom_fields_task = asyncio.ensure_future(app_instance.get_custom_fields_index())
+        try:
+            contact = await app_instance.contact_lookup(query)
+        except Exception:
+            custom_fields_task.cancel()
+            raise
         if contact is None:
+            custom_fields_task.cancel()
             self.job['state'] = JOB_STATES[2]
             self.job['state_msg'] = f"Contact not found, skipping update."
             return self.job
-        custom_fields = app_instance.get_custom_fields()
-        data = {
-            "firstName": self.data['first_name'],
-            "lastName": self.data['last_name'],
-            "email": self.data['email'],
-            "phone": "+1" + phone,
-            "address1": self.data['address'],
-            "city": self.data['city'],
-            "state": self.data['state'],
-            "postalCode": self.data['postal_code'],
-            "customField": self.set_custom_fields(self.data, contact, custom_fields)
-        }
-        contact_response = app_instance.update_contact(contact['id'], data)
+        custom_fields = await custom_fields_task
+        contact_response = await app_instance.update_contact(
+            contact['id'], self.contact_data(phone, contact, custom_fields))
         notes_response = {}
         if self.data['notes']:
-            notes_response = app_instance.add_notes(
+            notes_response = await app_instance.add_notes(
                 contact['id'], self.data['notes'],
                 self.config['params']['userId']
             )
@@ -684,26 +1373,42 @@ class Five9ToGHL(AbstractService):
         }
         return self.job
 
+    def contact_data(self, phone, contact, custom_fields):
+        return {
+            "firstName": self.data['first_name'],
+            "lastName": self.data['last_name'],
+            "email": self.data['email'],
+            "phone": "+1" + phone,
+            "address1": self.data['address'],
+            "city": self.data['city'],
+            "state": self.data['state'],
+            "postalCode": self.data['postal_code'],
+            "customField": self.set_custom_fields(self.data, contact, custom_fields)
+        }
+
     def set_five9_client(self, username, password):
-        return Five9Custom(username, password)
+        return client_pool.get(Five9Custom, username, password)
 
     def set_custom_fields(self, data, contact, custom_fields):
+        """
+        :param dict custom_fields: field key -> custom field id, see GHL.get_custom_fields_index.
+        """
         obj = {}
-        for field in custom_fields:
-            custom_field = field['fieldKey'].split(".")[1]
-            if custom_field in data.keys() and data[custom_field] != "":
-                if custom_field == "disposition":
-                    disposition = None
-                    if 'customField' in contact:
-                        disposition = self.is_disposition_set(
-                            field['id'], contact['customField'])
-                    if disposition and data[custom_field] == disposition.replace(".", ''):
-
-                        obj[field['id']] = disposition + "."
-                    else:
-                        obj[field['id']] = data[custom_field]
+        for custom_field, value in data.items():
+            field_id = custom_fields.get(custom_field)
+            if field_id is None or value == "":
+                continue
+            if custom_field == "disposition":
+                disposition = None
+                if 'customField' in contact:
+                    disposition = self.is_disposition_set(
+                        field_id, contact['customField'])
+                if disposition and value == disposition.replace(".", ''):
+                    obj[field_id] = disposition + "."
                 else:
-                    obj[field['id']] = data[custom_field]
+                    obj[field_id] = value
+            else:
+                obj[field_id] = value
         return obj
 
     def is_disposition_set(self, field_id, custom_fields_array):
@@ -809,28 +1514,93 @@ class GHLPipelineSync(AbstractService):
             self.job['state'] = JOB_STATES[2]
             self.job['state_msg'] = f"Request missing phone and email."
             return self.job
-        app_instance = self.app(self.config['params']['apiKey'], self.config['params']['locationId'])
+        app_instance = self.get_app_instance(self.config['params']['apiKey'], self.config['params']['locationId'])
+        query = f"phone=+1{self.data['phone']}&email={self.data['email']}"
+        with TaskGraph() as graph:
+            # the pipeline and its opportunities don't depend on the contact
+            graph.add('contact', app_instance.contact_lookup, query)
+            graph.add('pipeline_stage', self.find_pipeline_stage, app_instance)
+            graph.add('opportunities', self.find_opportunities, app_instance, after=('pipeline_stage',))
+            contact = graph.result('contact')
+            if contact is None:
+                self.job['state'] = JOB_STATES[2]
+                self.job['state_msg'] = f"Contact not found, skipping update."
+                return self.job
+            pipeline_index, stage = graph.result('pipeline_stage')
+            opportunities = graph.result('opportunities')
+        if not self.check_pipeline_stage(pipeline_index, stage):
+            return self.job
+        pipeline = pipeline_index['pipeline']
+        data = self.opportunity_data(stage, contact)
+        if opportunities is None:
+            self.job = GHLPipelineSync.create_opportunity(self.app, pipeline['id'], data, stage, self.config, self.job)
+        else:
+            self.job = GHLPipelineSync.update_opportunity(self.app,pipeline['id'],opportunities[0]['id'], data, stage, self.config, self.job)
+        self.job['state'] = JOB_STATES[1]
+        return self.job
+
+    async def execute_service_async(self) -> dict:
+        self.data = GHLPipelineSync.set_data_fields_complete(self.data, self.config['params']['requiredFields'])
+        if self.data['phone'] == "" and self.data['email'] == "":
+            self.job['state'] = JOB_STATES[2]
+            self.job['state_msg'] = f"Request missing phone and email."
+            return self.job
+        app_instance = self.get_async_app_instance(self.config['params']['apiKey'], self.config['params']['locationId'])
         query = f"phone=+1{self.data['phone']}&email={self.data['email']}"
-        contact = app_instance.contact_lookup(query)
+
+        async def find_pipeline_opportunities():
+            pipeline_stage = await self.find_pipeline_stage_async(app_instance)
+            return pipeline_stage, await self.find_opportunities_async(app_instance, pipeline_stage)
+
+        # the pipeline and its opportunities don't depend on the contact
+        pipeline_task = asyncio.ensure_future(find_pipeline_opportunities())
+        try:
+            contact = await app_instance.contact_lookup(query)
+        except Exception:
+            pipeline_task.cancel()
+            raise
         if contact is None:
+            pipeline_task.cancel()
             self.job['state'] = JOB_STATES[2]
             self.job['state_msg'] = f"Contact not found, skipping update."
             return self.job
-        pipeline = GHLPipelineSync.search_pipeline(
-            self.data['pipeline_name'], app_instance.get_pipelines())
-        if pipeline is None:
+        (pipeline_index, stage), opportunities = await pipeline_task
+        if not self.check_pipeline_stage(pipeline_index, stage):
+            return self.job
+        pipeline = pipeline_index['pipeline']
+        data = self.opportunity_data(stage, contact)
+        if opportunities is None:
+            opportunity = await app_instance.create_opportunity(pipeline['id'], data)
+            state_opp = "created"
+        else:
+            opportunity = await app_instance.update_opportunity(pipeline['id'], opportunities[0]['id'], data)
+            state_opp = "updated"
+        # the DNC add goes through the blocking Five9 client
+        self.job = await asyncio.get_running_loop().run_in_executor(
+            None, GHLPipelineSync.add_phone_to_dnc, data['phone'], self.config, self.job, stage, opportunity, state_opp)
+        self.job['state'] = JOB_STATES[1]
+        return self.job
+
+    def check_pipeline_stage(self, pipeline_index: dict, stage: dict) -> bool:
+        """
+        Notifies the recipients and skips the job when the pipeline or stage is missing.
+        :return True when both were found.
+        """
+        if pipeline_index is None:
             GHLPipelineSync.send_notification(f"Pipeline {self.data['pipeline_name']}", "Pipeline", self.config['name'], self.config['params']['recipients'])
             self.job['state'] = JOB_STATES[2]
             self.job['state_msg'] = f"Pipeline not found, skipping update."
-            return self.job
-        stage = GHLPipelineSync.search_stage(
-            self.data['pipleline_stage'], pipeline['stages'], self.config['params']['stageToAddDnc'])
+            return False
+        pipeline = pipeline_index['pipeline']
         if stage is None:
             GHLPipelineSync.send_notification(f"Stage {self.data['pipleline_stage']} on Pipeline {pipeline['name']}", "Stage", self.config['name'], self.config['params']['recipients'])
             self.job['state'] = JOB_STATES[2]
             self.job['state_msg'] = f"Stage not found, skipping update."
-            return self.job
-        data = {
+            return False
+        return True
+
+    def opportunity_data(self, stage: dict, contact: dict) -> dict:
+        return {
             "title": self.data['opportunity_name'] if self.data['opportunity_name'] != "" else "They Doe",
             "status": self.data['status'],
             "stageId": stage['id'],
@@ -843,23 +1613,63 @@ class GHLPipelineSync(AbstractService):
             "companyName": self.data['company_name'],
             "tags": self.data['tags'].split(",") if self.data['tags'] != "" else []
         }
-        opportunities = app_instance.get_opportunities(pipeline['id'], f"{self.data['phone'] if self.data['phone'] != '' else self.data['email']}")
-        if opportunities is None:
-            self.job = GHLPipelineSync.create_opportunity(self.app, pipeline['id'], data, stage, self.config, self.job)
-        else:
-            self.job = GHLPipelineSync.update_opportunity(self.app,pipeline['id'],opportunities[0]['id'], data, stage, self.config, self.job)
-        self.job['state'] = JOB_STATES[1]
-        return self.job
+
+    def find_pipeline_stage(self, app_instance: GHL) -> tuple:
+        # Pipelines are cached, when the pipeline or stage is missing the cache
+        # is refreshed once in case they were created after it was loaded.
+        for refresh in [False, True]:
+            if refresh:
+                app_instance.invalidate_metadata('pipelines')
+            pipeline_index = GHLPipelineSync.search_pipeline(
+                self.data['pipeline_name'], app_instance.get_pipelines_index())
+            if pipeline_index is None:
+                continue
+            stage = GHLPipelineSync.search_stage(
+                self.data['pipleline_stage'], pipeline_index, self.config['params']['stageToAddDnc'])
+            if stage is not None:
+                return pipeline_index, stage
+        return pipeline_index, None
+
+    def find_opportunities(self, app_instance: GHL, pipeline_stage: tuple) -> list:
+        pipeline_index, stage = pipeline_stage
+        if pipeline_index is None or stage is None:
+            return None
+        return app_instance.get_opportunities(
+            pipeline_index['pipeline']['id'],
+            f"{self.data['phone'] if self.data['phone'] != '' else self.data['email']}")
+
+    async def find_pipeline_stage_async(self, app_instance: AsyncGHL) -> tuple:
+        # same as find_pipeline_stage with the async client
+        for refresh in [False, True]:
+            if refresh:
+                app_instance.invalidate_metadata('pipelines')
+            pipeline_index = GHLPipelineSync.search_pipeline(
+                self.data['pipeline_name'], await app_instance.get_pipelines_index())
+            if pipeline_index is None:
+                continue
+            stage = GHLPipelineSync.search_stage(
+                self.data['pipleline_stage'], pipeline_index, self.config['params']['stageToAddDnc'])
+            if stage is not None:
+                return pipeline_index, stage
+        return pipeline_index, None
+
+    async def find_opportunities_async(self, app_instance: AsyncGHL, pipeline_stage: tuple) -> list:
+        pipeline_index, stage = pipeline_stage
+        if pipeline_index is None or stage is None:
+            return None
+        return await app_instance.get_opportunities(
+            pipeline_index['pipeline']['id'],
+            f"{self.data['phone'] if self.data['phone'] != '' else self.data['email']}")
 
     @classmethod
     def create_opportunity(cls, app: GHL, pipeline_id: str, data: dict, stage: dict, config: dict, job: dict) -> dict:
-        app_instance = app(config['params']['apiKey'], config['params']['locationId'])
+        app_instance = client_pool.get(app, config['params']['apiKey'], config['params']['locationId'])
         new_opportunity = app_instance.create_opportunity(pipeline_id, data)
         return GHLPipelineSync.add_phone_to_dnc(data['phone'], config, job, stage, new_opportunity, "created")
 
     @classmethod
     def update_opportunity(cls, app: GHL, pipeline_id: str, opportunity_id: str, data: dict, stage: dict, config: dict, job: dict) -> dict:
-        app_instance = app(config['params']['apiKey'], config['params']['locationId'])
+        app_instance = client_pool.get(app, config['params']['apiKey'], config['params']['locationId'])
         opportunity_updated = app_instance.update_opportunity(pipeline_id, opportunity_id, data)
         return GHLPipelineSync.add_phone_to_dnc(data['phone'], config, job, stage, opportunity_updated, "updated")
 
@@ -871,13 +1681,16 @@ class GHLPipelineSync(AbstractService):
             }
             return job
         if stage['add_dnc']:
-            five9_client = Five9Custom(
+            five9_client = client_pool.get(
+                Five9Custom,
                 config['params']['user'],
                 config['params']['password']
             )
             phone = phone.replace('+1', '')
             phone_number = [int(phone)]
-            five9_response = five9_client.add_to_dnc(phone_number)
+            five9_response = get_dnc_writer(five9_client).add(phone_number)
+            if any(report['rejected'] for report in five9_response):
+                raise ApiError(500, "Number could not be added to the DNC list, status code: {}")
             job['state_msg'] = {
                 f"opportunity_{state_opp}": opportunity,
                 "dnc_added": five9_response
@@ -889,26 +1702,23 @@ class GHLPipelineSync(AbstractService):
         return job
 
     @classmethod
-    def search_pipeline(cls, pipeline_name: str, pipelines: list) -> dict:
-        for pipeline in pipelines:
-            if pipeline['name'] == pipeline_name:
-                return pipeline
-        return None
+    def search_pipeline(cls, pipeline_name: str, pipelines: dict) -> dict:
+        """
+        :param dict pipelines: the pipelines index returned by GHL.get_pipelines_index.
+        :return the index entry of the pipeline or None when it does not exist.
+        """
+        return pipelines.get(pipeline_name)
 
     @classmethod
-    def search_stage(cls, stage_name: str, stages: list, stage_to_add_dnc: str) -> dict:
-        _stage_position = None
-        for stage in stages:
-            if stage['name'] == stage_to_add_dnc:
-                _stage_position = stages.index(stage)
-            if stage['name'] == stage_name:
-                if _stage_position is None:
-                    stage['add_dnc'] = False
-                    return stage
-                stage['add_dnc'] = True if stages.index(stage) >= _stage_position else False
-                return stage
-            stage['add_dnc'] = False
-        return None
+    def search_stage(cls, stage_name: str, pipeline_index: dict, stage_to_add_dnc: str) -> dict:
+        position = pipeline_index['stages'].get(stage_name)
+        if position is None:
+            return None
+        dnc_position = pipeline_index['stages'].get(stage_to_add_dnc)
+        # copy so the cached pipeline is not modified
+        stage = dict(pipeline_index['pipeline']['stages'][position])
+        stage['add_dnc'] = dnc_position is not None and position >= dnc_position
+        return stage
 
     @classmethod
     def send_notification(cls, missing_msg: str, missing_attribute: str, campaign_name: str, recipients: list) -> None:
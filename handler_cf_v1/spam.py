@@ -0,0 +1,127 @@
+from html.parser import HTMLParser
+import codecs
+from .exceptions import ApiError
+
+
+class VisibleTextScanner(HTMLParser):
+
+    """
+    Incremental HTML scanner that looks for a string in the visible text of a
+    page, text inside SKIPPED_TAGS is ignored and line breaks are removed so it
+    matches what BeautifulSoup(...).get_text() returned after extracting them.
+    Feed chunks as they arrive and stop as soon as found is True.
+    """
+
+    SKIPPED_TAGS = {"script", "style", "footer", "ul", "nav"}
+
+    def __init__(self, needle: str) -> None:
+        super().__init__(convert_charrefs=True)
+        self.needle = needle
+        self.skipped_depth = 0
+        self.tail = ""
+        self.found = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self.skipped_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        pass
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self.skipped_depth:
+            self.skipped_depth -= 1
+
+    def handle_data(self, data):
+        if self.skipped_depth or self.found:
+            return
+        # keep the end of the previous text in case the needle is split
+        text = self.tail + data.replace("\n", "")
+        if self.needle in text:
+            self.found = True
+        self.tail = text[-(len(self.needle) - 1):] if len(self.needle) > 1 else ""
+
+
+class SpamLookupProvider:
+
+    """
+    Base class of the sites used to check if an ANI is flagged as spam.
+    Subclasses set url and headers and implement classify, the response is
+    streamed so classify can stop reading the body once it has a verdict.
+    """
+
+    url = None
+    headers = {}
+    chunk_size = 8192
+
+    def lookup(self, ani: str, transport, **kwargs) -> bool:
+        """
+        :param HttpTransport transport: the transport used to send the request.
+        :param kwargs: passed to transport.request_with_retry, e.g. timeout.
+        :return True when the ANI is flagged as spam.
+        """
+        response = transport.request_with_retry(
+            'GET', self.lookup_url(ani), headers=self.headers, stream=True, **kwargs)
+        try:
+            return self.classify(response)
+        finally:
+            response.close()
+
+    def lookup_url(self, ani: str) -> str:
+        return self.url.format(ani)
+
+    def classify(self, response) -> bool:
+        raise NotImplementedError
+
+    def iter_text(self, response):
+        decoder = codecs.getincrementaldecoder(
+            response.encoding or "utf-8")(errors="replace")
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+
+class NomoroboProvider(SpamLookupProvider):
+
+    """
+    nomorobo shows a 404 page for numbers it has no reports of, any other page
+    means the number is flagged. Other error statuses (e.g. 403 or 429) raise
+    ApiError so the lookup counts as failed instead of as spam.
+    """
+
+    url = 'https://www.nomorobo.com/lookup/{}'
+    headers = {
+        'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+        'accept-encoding': 'gzip, deflate',
+        'accept-language': 'en-US,en;q=0.8',
+        'upgrade-insecure-requests': '1',
+        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/61.0.3163.100 Safari/537.36'
+    }
+
+    def lookup_url(self, ani: str) -> str:
+        return self.url.format("{}-{}-{}".format(ani[:3], ani[3:6], ani[6::]))
+
+    def classify(self, response) -> bool:
+        if response.status_code == 404:
+            return False
+        if response.status_code != 200:
+            raise ApiError(response.status_code)
+        return not NomoroboProvider.scan(self.iter_text(response))
+
+    @classmethod
+    def scan(cls, chunks) -> bool:
+        """
+        :return True when "404" is part of the visible text of the page.
+        """
+        scanner = VisibleTextScanner("404")
+        for chunk in chunks:
+            scanner.feed(chunk)
+            if scanner.found:
+                return True
+        scanner.close()
+        return scanner.found
+
+
+SPAM_PROVIDERS = {
+    'nomorobo': NomoroboProvider
+}
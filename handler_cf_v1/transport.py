@@ -0,0 +1,211 @@
+from collections import defaultdict
+from urllib.parse import urlsplit
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HostRateLimiter:
+
+    """
+    Spaces the requests sent to each host so no more than rate requests per
+    second are sent to it, across every thread using the limiter.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, host: str) -> None:
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot.get(host, now), now)
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class HttpTransport:
+
+    """
+    Pooled requests.Session shared by the HTTP app clients.
+    Connections are kept alive between calls so jobs that hit the same host
+    (e.g. several calls to rest.gohighlevel.com) skip the TCP and TLS handshakes.
+    :param int pool_size: max connections kept alive per host.
+    :param int pool_connections: max number of hosts with a connection pool.
+    """
+
+    def __init__(self, pool_size: int = 10, pool_connections: int = 10) -> None:
+        self.pool_size = pool_size
+        self.pool_connections = pool_connections
+        self.lock = threading.Lock()
+        self.request_counts = defaultdict(int)
+        self.session = self.create_session()
+
+    def create_session(self) -> requests.Session:
+        session = requests.Session()
+        self.adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_size
+        )
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        })
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        with self.lock:
+            self.request_counts[urlsplit(url).netloc] += 1
+        return self.session.request(method, url, **kwargs)
+
+    def request_with_retry(self, method: str, url: str, retries: int = 2, backoff: float = 0.5,
+                           rate_limiter: HostRateLimiter = None,
+                           retry_statuses=(429, 500, 502, 503, 504), **kwargs) -> requests.Response:
+        """
+        Sends the request retrying connection errors and retry_statuses responses
+        with exponential backoff and jitter, waiting on rate_limiter before each attempt.
+        """
+        host = urlsplit(url).netloc
+        for attempt in range(retries + 1):
+            if rate_limiter is not None:
+                rate_limiter.wait(host)
+            try:
+                response = self.request(method, url, **kwargs)
+                if response.status_code not in retry_statuses or attempt == retries:
+                    return response
+                response.close()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == retries:
+                    raise
+            time.sleep(backoff * 2 ** attempt * (0.5 + random.random()))
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
+
+    def metrics(self) -> dict:
+        """
+        Returns per host request and connection counts, reused is the number of
+        requests that were sent over an already open connection.
+        """
+        metrics = {}
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            host_metrics = metrics.setdefault(
+                host, {'requests': 0, 'connections': 0, 'reused': 0})
+            host_metrics['requests'] += pool.num_requests
+            host_metrics['connections'] += pool.num_connections
+            host_metrics['reused'] += max(pool.num_requests - pool.num_connections, 0)
+        for host, count in self.request_counts.items():
+            metrics.setdefault(
+                host, {'requests': 0, 'connections': 0, 'reused': 0})['sent'] = count
+        return metrics
+
+    def close(self) -> None:
+        self.session.close()
+
+
+http_transport = HttpTransport(
+    pool_size=int(os.environ.get('HTTP_POOL_SIZE', 10)),
+    pool_connections=int(os.environ.get('HTTP_POOL_CONNECTIONS', 10))
+)
+
+
+class AsyncResponse:
+
+    """
+    Response of AsyncHttpTransport, the body is read before the connection is
+    released so it offers the status_code, json() and text of requests.Response.
+    """
+
+    def __init__(self, status_code: int, content: bytes, headers, encoding: str = None) -> None:
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.encoding = encoding or "utf-8"
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncHttpTransport:
+
+    """
+    Pooled aiohttp.ClientSession shared by the async app clients, one session
+    is kept per event loop since aiohttp sessions can't be shared between loops.
+    Call close before the loop ends, sessions left by loops that were closed
+    are dropped on the next get_session.
+    aiohttp is imported on first use, install the async extra to use it.
+    :param int limit: max connections open at the same time.
+    :param int limit_per_host: max connections open to the same host.
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 10) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.sessions = {}
+        self.request_counts = defaultdict(int)
+
+    def get_session(self):
+        loop = asyncio.get_running_loop()
+        for closed in [closed for closed in self.sessions if closed.is_closed()]:
+            # the session can't be closed without its loop, only the reference is released
+            del self.sessions[closed]
+        session = self.sessions.get(loop)
+        if session is None or session.closed:
+            import aiohttp
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit, limit_per_host=self.limit_per_host),
+                headers={'Accept-Encoding': 'gzip, deflate'}
+            )
+            self.sessions[loop] = session
+        return session
+
+    async def request(self, method: str, url: str, **kwargs) -> AsyncResponse:
+        self.request_counts[urlsplit(url).netloc] += 1
+        async with self.get_session().request(method, url, **kwargs) as response:
+            content = await response.read()
+            return AsyncResponse(response.status, content, response.headers, response.charset)
+
+    async def get(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request('POST', url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request('PUT', url, **kwargs)
+
+    async def close(self) -> None:
+        session = self.sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+async_http_transport = AsyncHttpTransport(
+    limit=int(os.environ.get('ASYNC_HTTP_LIMIT', 100)),
+    limit_per_host=int(os.environ.get('ASYNC_HTTP_LIMIT_PER_HOST', 10))
+)
@@ -1,9 +1,19 @@
-from google.cloud import firestore
+from __future__ import annotations
+from typing import TYPE_CHECKING
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import atexit
+import os
+import queue
 import smtplib
 import ssl
-import pandas as pd
+import threading
+import time
+
+if TYPE_CHECKING:
+    from google.cloud import firestore
 
 
 def get_doc(db: firestore.Client, collection: str, id: str) -> dict:
@@ -21,6 +31,35 @@ def query_doc(db: firestore.Client, collection: str, field: str, operator: str,
     return query
 
 
+def stream_pages(db: firestore.Client, collection: str, field: str, operator: str, value: str,
+                 fields: list = None, page_size: int = 200, start_after: str = None, end_at: str = None):
+    """
+    Yields the documents matching the query as lists of at most page_size
+    snapshots, ordered by document id and paged with a cursor so only one page
+    is held in memory.
+    :param list fields: optional field paths to read instead of the whole document.
+    :param str start_after: the document id to resume after, e.g. the last id of a previous page.
+    :param str end_at: the id of the last document to return.
+    """
+    query = db.collection(collection).where(field, operator, value).order_by('__name__')
+    if fields:
+        query = query.select(fields)
+    if end_at is not None:
+        query = query.end_at({'__name__': db.collection(collection).document(end_at)})
+    last_id = start_after
+    while True:
+        page_query = query
+        if last_id is not None:
+            page_query = page_query.start_after(
+                {'__name__': db.collection(collection).document(last_id)})
+        page = list(page_query.limit(page_size).stream())
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        last_id = page[-1].id
+
+
 def update_doc(db: firestore.Client, collection: str, id: str, doc: dict, state_msg=None) -> dict:
     if state_msg:
         doc['state_msg'] = state_msg
@@ -28,31 +67,251 @@ def update_doc(db: firestore.Client, collection: str, id: str, doc: dict, state_
     return db.collection(collection).document(id).get().to_dict()
 
 
-def send_email(sender: str, password: str, to: list, subject: str, body: str) -> None:
-    # try catch is necessary so email errors are not raised and
-    # the execution is not retried.
-    try:
-        message = MIMEMultipart("alternative")
-        message['Subject'] = subject
-        message['From'] = sender
-        message['To'] = ",".join(to)
+class BatchWriter:
+
+    """
+    Collects document writes into Firestore WriteBatch commits, a batch is
+    committed when it reaches MAX_OPERATIONS writes and when the writer is closed.
+    """
+
+    MAX_OPERATIONS = 500
+
+    def __init__(self, db: firestore.Client) -> None:
+        self.db = db
+        self.batch = None
+        self.operations = 0
+        self.commits = 0
+
+    def update(self, collection: str, id: str, fields: dict) -> None:
+        self.add(lambda batch: batch.update(
+            self.db.collection(collection).document(id), fields))
+
+    def set(self, collection: str, id: str, doc: dict, merge: bool = False) -> None:
+        self.add(lambda batch: batch.set(
+            self.db.collection(collection).document(id), doc, merge=merge))
+
+    def delete(self, collection: str, id: str) -> None:
+        self.add(lambda batch: batch.delete(
+            self.db.collection(collection).document(id)))
+
+    def add(self, write) -> None:
+        if self.batch is None:
+            self.batch = self.db.batch()
+        write(self.batch)
+        self.operations += 1
+        if self.operations >= BatchWriter.MAX_OPERATIONS:
+            self.commit()
+
+    def commit(self) -> None:
+        if self.batch is None:
+            return
+        self.batch.commit()
+        self.batch = None
+        self.operations = 0
+        self.commits += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # writes are committed on errors too, they reflect changes already made in Five9
+        self.commit()
+
+
+class TaskGraph:
+
+    """
+    Runs the independent calls of a job concurrently, a task starts once the
+    tasks it runs after have finished and receives their results after its
+    own arguments. Results are read with result(name), which raises the error
+    of the task, so the caller keeps checking them in its original order.
+
+    with TaskGraph() as graph:
+        graph.add('contact', app_instance.contact_lookup, query)
+        graph.add('fields', app_instance.get_custom_fields_index)
+        contact = graph.result('contact')
+    """
+
+    def __init__(self, max_workers: int = 4) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = {}
+
+    def add(self, name: str, func, *args, after: tuple = ()) -> None:
+        # dependencies are added first, so a task only waits on tasks that
+        # were submitted before it and the pool can't deadlock
+        dependencies = [self.futures[dependency] for dependency in after]
+
+        def run():
+            return func(*args, *[future.result() for future in dependencies])
+
+        self.futures[name] = self.executor.submit(run)
+
+    def result(self, name: str):
+        return self.futures[name].result()
 
-        part1 = MIMEText(body, "plain")
-        part2 = MIMEText(body, "html")
+    def close(self) -> None:
+        # tasks whose results are not needed are cancelled if they did not start
+        for future in self.futures.values():
+            future.cancel()
+        self.executor.shutdown(wait=False)
 
-        message.attach(part1)
-        message.attach(part2)
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class MailTransport:
+
+    """
+    Sends emails over one authenticated SMTP_SSL connection per sender, kept
+    open between sends and opened again when the server drops it or it was
+    idle for more than idle_timeout seconds, failed sends are retried up to
+    retries times.
+
+    Emails are sent before send_email returns and errors other than
+    SMTPDataError are raised, as a function may be throttled or stopped once
+    it responds. Inside queued(), e.g. while JobDispatcher runs the jobs, or
+    with always_queue set they are queued and sent by a background thread so
+    jobs don't wait on SMTP, send errors are then only printed. queued()
+    waits for the queue to be sent when it exits.
+    """
+
+    def __init__(self, host: str = "smtp.gmail.com", port: int = 465, retries: int = 2,
+                 backoff: float = 1, idle_timeout: float = 240, queue_size: int = 1000,
+                 always_queue: bool = False) -> None:
+        self.host = host
+        self.port = port
+        self.retries = retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.connections = {}
+        self.lock = threading.Lock()
+        self.worker_lock = threading.Lock()
+        self.worker = None
+        self.always_queue = always_queue
+        self.queued_scopes = 0
+        atexit.register(self.flush)
+
+    @property
+    def queueing(self) -> bool:
+        return self.always_queue or self.queued_scopes > 0
+
+    @contextmanager
+    def queued(self):
+        self.start_queueing()
+        try:
+            yield self
+        finally:
+            self.stop_queueing()
+
+    def start_queueing(self) -> None:
+        with self.worker_lock:
+            self.queued_scopes += 1
+
+    def stop_queueing(self) -> None:
+        # the emails queued so far are sent before returning
+        with self.worker_lock:
+            self.queued_scopes -= 1
+        self.flush()
+
+    def send(self, sender: str, password: str, to: list, message: str) -> None:
+        with self.worker_lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run, daemon=True)
+                self.worker.start()
+        self.queue.put((sender, password, to, message))
+
+    def run(self) -> None:
+        while True:
+            sender, password, to, message = self.queue.get()
+            try:
+                self.deliver(sender, password, to, message)
+            except Exception as error:
+                print(f"Email to {', '.join(to)} could not be sent: {error}")
+            finally:
+                self.queue.task_done()
+
+    def deliver(self, sender: str, password: str, to: list, message: str) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                with self.lock:
+                    server = self.connect(sender, password)
+                    server.sendmail(sender, to, message)
+                    self.connections[sender] = (server, time.monotonic())
+                return
+            except smtplib.SMTPDataError:
+                # rejected messages are not retried
+                return
+            except smtplib.SMTPAuthenticationError:
+                self.disconnect(sender)
+                raise
+            except (smtplib.SMTPException, OSError):
+                self.disconnect(sender)
+                if attempt == self.retries:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def connect(self, sender: str, password: str) -> smtplib.SMTP_SSL:
+        connection = self.connections.get(sender)
+        if connection is not None:
+            server, last_used = connection
+            if time.monotonic() - last_used < self.idle_timeout:
+                return server
+            self.disconnect(sender)
         context = ssl.create_default_context()
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-            server.login(sender, password)
-            server.sendmail(
-                sender, to, message.as_string()
-            )
-    except smtplib.SMTPDataError:
-        pass
+        server = smtplib.SMTP_SSL(self.host, self.port, context=context)
+        server.login(sender, password)
+        self.connections[sender] = (server, time.monotonic())
+        return server
+
+    def disconnect(self, sender: str) -> None:
+        connection = self.connections.pop(sender, None)
+        if connection is None:
+            return
+        try:
+            connection[0].quit()
+        except (smtplib.SMTPException, OSError):
+            connection[0].close()
+
+    def flush(self) -> None:
+        """
+        Waits until the queued messages are sent.
+        """
+        if self.worker is not None and self.worker.is_alive():
+            self.queue.join()
+
+
+mail_transport = MailTransport(
+    retries=int(os.environ.get('SMTP_RETRIES', 2)),
+    idle_timeout=float(os.environ.get('SMTP_IDLE_TIMEOUT', 240)),
+    always_queue=os.environ.get('SMTP_ASYNC', '0') == '1'
+)
+
+
+def send_email(sender: str, password: str, to: list, subject: str, body: str) -> None:
+    # Emails are sent right away unless mail_transport is queueing, see MailTransport.
+    # SMTPDataError is not raised so the execution is not retried.
+    message = MIMEMultipart("alternative")
+    message['Subject'] = subject
+    message['From'] = sender
+    message['To'] = ",".join(to)
+
+    part1 = MIMEText(body, "plain")
+    part2 = MIMEText(body, "html")
+
+    message.attach(part1)
+    message.attach(part2)
+
+    if mail_transport.queueing:
+        mail_transport.send(sender, password, to, message.as_string())
+    else:
+        mail_transport.deliver(sender, password, to, message.as_string())
 
 
 def generate_markdown(data):
+    import pandas as pd
     df = pd.DataFrame(data=data, index=[0])
     return df.to_html(index=False)
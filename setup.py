@@ -18,7 +18,8 @@ setuptools.setup(
         "Bug Tracker": "https://github.com/luigicfh/cf_handler_module/issues"
     },
     install_requires=['requests', 'five9',
-                      'google-cloud-firestore', 'pandas', "beautifulsoup4", "sqlalchemy", 'pymysql'],
+                      'google-cloud-firestore', 'pandas', "sqlalchemy", 'pymysql'],
+    extras_require={'async': ['aiohttp']},
     keywords=["pypi", "handler_module", "cloud_functions"],
     classifiers=[                                   # https://pypi.org/classifiers
         'Development Status :: 3 - Alpha',